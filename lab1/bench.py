@@ -0,0 +1,237 @@
+'''
+Benchmark of the star finder on synthetic star fields.
+
+Example:
+    python bench.py --sizes 2000x2000 8000x6000 --processes 1 4 \
+        --layouts strips:20 tiles:auto tiles:512 -o bench.json
+
+    # одна смешанная пачка: статическое распределение против динамического
+    python bench.py --mixed --sizes 12000x9000 1000x800 1000x800 1000x800
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import itertools
+import contextlib
+import multiprocessing
+import numpy as np
+import cv2
+
+from main import parallel_process_images, THRESHOLD, CLIP_LIMIT, TILE_GRID_SIZE
+from catalog import measure_stars
+
+
+def make_star_field(path, width, height, density, seed=0):
+    '''
+    Writes a noisy dark frame with `density` stars per megapixel of random
+    size and brightness.
+    '''
+    rng = np.random.default_rng(seed)
+    img = rng.normal(20, 6, (height, width)).clip(0, 255).astype(np.uint8)
+
+    n_stars = int(density * width * height / 1e6)
+    xs = rng.integers(0, width, n_stars)
+    ys = rng.integers(0, height, n_stars)
+    radii = rng.integers(1, 6, n_stars)
+    brightness = rng.integers(120, 256, n_stars)
+    for x, y, r, b in zip(xs.tolist(), ys.tolist(), radii.tolist(), brightness.tolist()):
+        cv2.circle(img, (x, y), r, b, -1)
+
+    img = cv2.GaussianBlur(img, (3, 3), 0)
+    cv2.imwrite(path, cv2.cvtColor(img, cv2.COLOR_GRAY2BGR))
+    return n_stars
+
+
+def stage_timings(image_path, threshold=THRESHOLD, clip_limit=CLIP_LIMIT, tile_grid_size=TILE_GRID_SIZE):
+    # Последовательный прогон всех стадий на целом изображении в одном процессе
+    timings = {}
+
+    start = time.perf_counter()
+    img = cv2.imread(image_path)
+    timings['decode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    timings['grayscale'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    enhanced = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size).apply(gray)
+    timings['clahe'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, thresholded = cv2.threshold(enhanced, threshold, 255, cv2.THRESH_BINARY)
+    timings['threshold'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    timings['contours'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    measure_stars(thresholded, gray)
+    timings['measure'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cv2.drawContours(img, contours, -1, (0, 255, 0), 2)
+    timings['draw'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cv2.imencode('.jpg', img)
+    timings['encode'] = time.perf_counter() - start
+
+    return timings
+
+
+def parse_layout(layout):
+    # strips:N - вертикальные полосы, tiles:auto или tiles:SIZE - квадратные плитки
+    kind, value = layout.split(':')
+    if kind == 'strips':
+        return {'num_chunks_per_image': int(value)}
+    if kind == 'tiles':
+        return {'tile_size': None if value == 'auto' else int(value)}
+    raise ValueError(f"Unknown layout {layout}")
+
+
+def run_config(image_paths, num_processes, options, queue):
+    # Каждый прогон идет в свежем процессе, чтобы пиковая память не копилась между прогонами
+    with tempfile.TemporaryDirectory() as output_folder, open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            _, n_elements = parallel_process_images(image_paths, output_folder, num_processes,
+                                                    show=False, **options)
+            wall = time.perf_counter() - start
+
+    queue.put({
+        'wall_s': wall,
+        'stars': n_elements,
+        'peak_rss_parent_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'peak_rss_worker_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    })
+
+
+def measure_config(image_paths, num_processes, options):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=run_config, args=(image_paths, num_processes, options, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def run_benchmark(sizes, densities, processes, layouts, shared_memory_modes, repeat=1, work_dir=None):
+    results = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        for (width, height), density in itertools.product(sizes, densities):
+            image_path = os.path.join(tmp, f"field_{width}x{height}_{density}.jpg")
+            make_star_field(image_path, width, height, density)
+            megapixels = width * height / 1e6
+            stages = stage_timings(image_path)
+            print(f"{width}x{height} density {density}: " +
+                  ', '.join(f"{stage} {seconds:.3f}s" for stage, seconds in stages.items()), file=sys.stderr)
+
+            for num_processes, layout, use_shared_memory in itertools.product(processes, layouts,
+                                                                              shared_memory_modes):
+                options = {'use_shared_memory': use_shared_memory, **parse_layout(layout)}
+                runs = [measure_config([image_path], num_processes, options) for _ in range(repeat)]
+                best = min(runs, key=lambda run: run['wall_s'])
+                result = {
+                    'width': width,
+                    'height': height,
+                    'density': density,
+                    'megapixels': megapixels,
+                    'processes': num_processes,
+                    'layout': layout,
+                    'shared_memory': use_shared_memory,
+                    'megapixels_per_s': megapixels / best['wall_s'],
+                    'stages_s': stages,
+                    **best,
+                }
+                results.append(result)
+                print(f"  processes {num_processes}, {layout}, shared memory {use_shared_memory}: "
+                      f"{result['megapixels_per_s']:.1f} MP/s, {best['wall_s']:.2f}s, "
+                      f"peak RSS {best['peak_rss_parent_mb']:.0f}/{best['peak_rss_worker_mb']:.0f} MB",
+                      file=sys.stderr)
+
+    return {'machine': machine_info(), 'results': results}
+
+
+def run_mixed_benchmark(sizes, density, processes, layouts, repeat=1, work_dir=None):
+    '''
+    Processes all sizes as one heterogeneous batch and compares the static
+    starmap split with largest-first dynamic scheduling.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        image_paths = []
+        for i, (width, height) in enumerate(sizes):
+            image_paths.append(os.path.join(tmp, f"field_{i}_{width}x{height}.jpg"))
+            make_star_field(image_paths[-1], width, height, density, seed=i)
+        megapixels = sum(width * height for width, height in sizes) / 1e6
+
+        for num_processes, layout in itertools.product(processes, layouts):
+            for dynamic_scheduling in (False, True):
+                options = {'use_shared_memory': True, 'dynamic_scheduling': dynamic_scheduling,
+                           **parse_layout(layout)}
+                runs = [measure_config(image_paths, num_processes, options) for _ in range(repeat)]
+                best = min(runs, key=lambda run: run['wall_s'])
+                result = {
+                    'sizes': [f"{width}x{height}" for width, height in sizes],
+                    'megapixels': megapixels,
+                    'processes': num_processes,
+                    'layout': layout,
+                    'scheduling': 'dynamic' if dynamic_scheduling else 'static',
+                    'megapixels_per_s': megapixels / best['wall_s'],
+                    **best,
+                }
+                results.append(result)
+                print(f"processes {num_processes}, {layout}, {result['scheduling']}: "
+                      f"{result['megapixels_per_s']:.1f} MP/s, {best['wall_s']:.2f}s", file=sys.stderr)
+
+    return {'machine': machine_info(), 'results': results}
+
+
+def machine_info():
+    return {
+        'cpu_count': multiprocessing.cpu_count(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+    }
+
+
+def parse_size(size):
+    width, height = size.lower().split('x')
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark star detection on synthetic star fields")
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(4000, 3000)], help="WIDTHxHEIGHT")
+    parser.add_argument('--densities', type=int, nargs='+', default=[200], help="stars per megapixel")
+    parser.add_argument('--processes', type=int, nargs='+', default=[multiprocessing.cpu_count()])
+    parser.add_argument('--layouts', nargs='+', default=['strips:20', 'tiles:auto'])
+    parser.add_argument('--shared-memory', choices=['on', 'off', 'both'], default='both')
+    parser.add_argument('--mixed', action='store_true', help="one batch of all sizes, static vs dynamic scheduling")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--work-dir', default=None, help="where synthetic images are written")
+    parser.add_argument('-o', '--output', default=None, help="JSON report path, stdout by default")
+    args = parser.parse_args()
+
+    if args.mixed:
+        report = run_mixed_benchmark(args.sizes, args.densities[0], args.processes, args.layouts,
+                                     args.repeat, args.work_dir)
+    else:
+        modes = {'on': [True], 'off': [False], 'both': [False, True]}[args.shared_memory]
+        report = run_benchmark(args.sizes, args.densities, args.processes, args.layouts, modes,
+                               args.repeat, args.work_dir)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
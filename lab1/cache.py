@@ -0,0 +1,91 @@
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+
+def image_content_hash(image_path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(image_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PreprocessCache:
+    '''
+    On-disk cache of preprocessed tiles (gray + CLAHE output) keyed by image
+    content hash, tile geometry and CLAHE parameters. Entries are .npy files;
+    a hit refreshes the file mtime and the least recently used files are
+    evicted once the directory grows past max_bytes. Safe to share between
+    worker processes: entries are written to a temp file and renamed.
+    '''
+    def __init__(self, cache_dir, max_bytes=1 << 30):
+        self.__cache_dir = cache_dir
+        self.__max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self):
+        return self.__cache_dir
+
+    @property
+    def max_bytes(self):
+        return self.__max_bytes
+
+    @staticmethod
+    def make_key(image_hash, chunk_data, clip_limit, tile_grid_size):
+        raw = f"{image_hash}:{tuple(chunk_data)}:{float(clip_limit)}:{tuple(tile_grid_size)}"
+        return hashlib.blake2b(raw.encode('utf8'), digest_size=16).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            value = np.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError, EOFError, OSError):
+            # Запись могли вытеснить или прочитать недописанной
+            return None
+        return value
+
+    def put(self, key, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, value)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.npy'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Запись уже удалил другой процесс
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        # Сначала удаляются давно не использованные записи
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
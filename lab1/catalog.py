@@ -0,0 +1,105 @@
+import os
+import numpy as np
+import cv2
+
+
+# Одна строка каталога на звезду; координаты в пикселях всего изображения
+STAR_DTYPE = np.dtype([
+    ('image', np.int32),
+    ('chunk', np.int32),
+    ('x', np.int32),
+    ('y', np.int32),
+    ('w', np.int32),
+    ('h', np.int32),
+    ('area', np.int32),
+    ('cx', np.float64),
+    ('cy', np.float64),
+    ('flux', np.float64),
+])
+
+
+def fill_holes(mask):
+    '''
+    Mask with the background enclosed by blobs filled in.
+    '''
+    # Фон, до которого нельзя дойти от края изображения, - дыры внутри объектов;
+    # рамка в 1 пиксель соединяет весь внешний фон в одну область
+    outside = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    cv2.floodFill(outside, None, (0, 0), 255)
+    return mask | cv2.bitwise_not(outside[1:-1, 1:-1])
+
+
+def measure_stars(mask, gray):
+    '''
+    Measures all connected blobs of a binary mask at once: bounding box,
+    pixel area, centroid and integrated flux of the gray image under the blob.
+    Holes are filled first, so a ring around a bright core is one star, as
+    drawn by its external contour; its area and flux include the hole.
+    '''
+    mask = fill_holes(mask)
+    n_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+    foreground = mask > 0
+    flux = np.bincount(labels[foreground], weights=gray[foreground], minlength=n_labels)
+
+    # Метка 0 - фон
+    stars = np.zeros(n_labels - 1, dtype=STAR_DTYPE)
+    stars['x'] = stats[1:, cv2.CC_STAT_LEFT]
+    stars['y'] = stats[1:, cv2.CC_STAT_TOP]
+    stars['w'] = stats[1:, cv2.CC_STAT_WIDTH]
+    stars['h'] = stats[1:, cv2.CC_STAT_HEIGHT]
+    stars['area'] = stats[1:, cv2.CC_STAT_AREA]
+    stars['cx'] = centroids[1:, 0]
+    stars['cy'] = centroids[1:, 1]
+    stars['flux'] = flux[1:]
+    return stars
+
+
+def select_owned(stars, x_offset, y_offset, core):
+    '''
+    Moves chunk-local stars to image coordinates and keeps only those whose
+    bounding-box center lies in the core region owned by the chunk.
+    '''
+    stars = stars.copy()
+    stars['x'] += x_offset
+    stars['y'] += y_offset
+    stars['cx'] += x_offset
+    stars['cy'] += y_offset
+
+    center_x = stars['x'] + stars['w'] // 2
+    center_y = stars['y'] + stars['h'] // 2
+    owned = ((core[0] <= center_x) & (center_x < core[2]) &
+             (core[1] <= center_y) & (center_y < core[3]))
+    return stars[owned]
+
+
+def save_catalog(path, image_paths, stars_per_image):
+    '''
+    Saves stars of several images as an uncompressed .npz with one array per
+    column, so single columns can be loaded without parsing the rest.
+    '''
+    stars = np.concatenate([np.asarray(s, dtype=STAR_DTYPE) for s in stars_per_image]
+                           or [np.empty(0, dtype=STAR_DTYPE)])
+    stars['image'] = np.repeat(np.arange(len(stars_per_image)), [len(s) for s in stars_per_image])
+    np.savez(path, images=np.array([os.path.basename(p) for p in image_paths]),
+             **{name: stars[name] for name in STAR_DTYPE.names})
+
+
+def load_catalog(path, columns=None):
+    '''
+    Returns image names and a dict of catalog columns.
+    '''
+    with np.load(path) as catalog:
+        names = columns or STAR_DTYPE.names
+        return catalog['images'], {name: catalog[name] for name in names}
+
+
+def write_obj_locations(path, image_paths, stars_per_image):
+    # Текстовый экспорт в прежнем формате obj_locations.txt
+    with open(path, 'w') as f:
+        for image_path, stars in zip(image_paths, stars_per_image):
+            name = os.path.basename(image_path)
+            f.writelines(f"output_{name}_{chunk}.png: x={x}, y={y}, w={w}, h={h}\n"
+                         for chunk, x, y, w, h in zip(stars['chunk'].tolist(), stars['x'].tolist(),
+                                                      stars['y'].tolist(), stars['w'].tolist(),
+                                                      stars['h'].tolist()))
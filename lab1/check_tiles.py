@@ -0,0 +1,87 @@
+'''
+Checks that tiled detection finds the same catalog as a single pass over
+the whole image on synthetic star fields.
+
+Example:
+    python check_tiles.py --sizes 3000x2000 --tile-sizes 256 512 auto --processes 2
+'''
+import os
+import sys
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+import cv2
+
+from main import detect_stars, find_stars_in_chunk
+from bench import make_star_field, parse_size
+
+# Столбцы, которые должны совпасть точно; номер плитки у прохода целиком свой
+EXACT_COLUMNS = ('x', 'y', 'w', 'h', 'area', 'flux')
+# Центры плитка считает в своих координатах, поэтому возможна ошибка округления
+FLOAT_COLUMNS = ('cx', 'cy')
+
+
+def single_pass_stars(image_path):
+    img = cv2.imread(image_path)
+    height, width = img.shape[:2]
+    _, stars = find_stars_in_chunk(img, (0, 0, width, height))
+    return stars
+
+
+def sort_stars(stars):
+    return stars[np.lexsort([stars[name] for name in reversed(EXACT_COLUMNS)])]
+
+
+def compare_catalogs(expected, got):
+    '''
+    Returns a description of the first difference or None if the catalogs are equal.
+    '''
+    if len(expected) != len(got):
+        return f"{len(got)} stars instead of {len(expected)}"
+    expected, got = sort_stars(expected), sort_stars(got)
+    for name in EXACT_COLUMNS:
+        differs = np.flatnonzero(expected[name] != got[name])
+        if len(differs):
+            i = differs[0]
+            return f"{name} differs at x={expected['x'][i]}, y={expected['y'][i]}: {expected[name][i]} != {got[name][i]}"
+    for name in FLOAT_COLUMNS:
+        if not np.allclose(expected[name], got[name], rtol=0, atol=1e-6):
+            return f"{name} differs"
+    return None
+
+
+def check_field(image_path, tile_sizes, overlap, num_processes):
+    expected = single_pass_stars(image_path)
+    errors = 0
+    with tempfile.TemporaryDirectory() as output_folder:
+        for tile_size in tile_sizes:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                result, = detect_stars([image_path], output_folder, num_processes,
+                                       tile_size=tile_size, overlap=overlap)
+            difference = compare_catalogs(expected, result['stars'])
+            errors += difference is not None
+            print(f"  tiles {tile_size or 'auto'}: {len(result['stars'])} stars, "
+                  f"single pass {len(expected)}: {difference or 'equal'}")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare tiled and single-pass star catalogs")
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(3000, 2000)], help="WIDTHxHEIGHT")
+    parser.add_argument('--density', type=int, default=200, help="stars per megapixel")
+    parser.add_argument('--tile-sizes', nargs='+', default=['256', '512', 'auto'])
+    parser.add_argument('--overlap', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=2)
+    args = parser.parse_args()
+
+    tile_sizes = [None if size == 'auto' else int(size) for size in args.tile_sizes]
+    errors = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (width, height) in enumerate(args.sizes):
+            image_path = os.path.join(tmp, f"field_{width}x{height}.jpg")
+            make_star_field(image_path, width, height, args.density, seed=i)
+            print(f"{width}x{height}:")
+            errors += check_field(image_path, tile_sizes, args.overlap, args.processes)
+    print(f"{errors} mismatches")
+    sys.exit(1 if errors else 0)
@@ -1,59 +1,171 @@
 import multiprocessing
 import os
+import sys
+import glob
+import json
+import time
+import argparse
+import resource
+from collections import deque
+from multiprocessing import shared_memory, resource_tracker
 import cv2
 from PIL import Image
 import numpy as np
-import tkinter as tk
-from tkinter import filedialog as fd
+from catalog import measure_stars, select_owned, save_catalog, write_obj_locations
+from cache import PreprocessCache, image_content_hash
+import profiling
+try:
+    import tkinter as tk
+    from tkinter import filedialog as fd
+except ImportError:
+    # На серверах без Tk доступен только консольный режим
+    tk = fd = None
 
 Image.MAX_IMAGE_PIXELS = 933120000
 
-def process_image_chunk(chunk, output_folder):
-    image_path, chunk_index, chunk_data = chunk
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff')
 
-    img = cv2.imread(image_path)
+# Параметры выделения звезд по умолчанию
+THRESHOLD = 200
+CLIP_LIMIT = 2.0
+TILE_GRID_SIZE = (8, 8)
+CACHE_SIZE = 1 << 30
 
-    result_chunk, contours = find_stars_in_chunk(img, chunk_data)
+def process_image_chunk(chunk, output_folder, shared_image=None, shared_output=None, save_chunks=False,
+                        detection=None, cache=None, profile=False, shared_planes=None):
+    image_path, chunk_index, chunk_data, core = chunk
+    threshold, clip_limit, tile_grid_size = detection or (THRESHOLD, CLIP_LIMIT, TILE_GRID_SIZE)
+    output_path = None
 
-    output_path = os.path.join(output_folder, f"output_{os.path.basename(image_path)}_{chunk_index}.png")
-    cv2.imwrite(output_path, result_chunk)
+    if profile:
+        profiling.enable()
+    task_start = profiling.now()
 
-    # Сохранение местоположения объектов
-    obj_locations = []
-    for contour in contours:
-        x, y, w, h = cv2.boundingRect(contour)
-        obj_locations.append((x + chunk_data[0], y + chunk_data[1], w, h))
+    shm = None
+    if shared_image is None:
+        with profiling.stage('decode', os.path.getsize(image_path)):
+            img = cv2.imread(image_path)
+    else:
+        # Изображение уже декодировано родителем, берем view без копирования
+        shm, img = attach_shared_image(shared_image)
+
+    out_shm = planes_shm = None
+    try:
+        x_start, y_start, x_end, y_end = chunk_data
+
+        preprocessed = None
+        if shared_planes is not None:
+            # Серое изображение и CLAHE уже посчитаны родителем для всего изображения
+            planes_shm, planes = attach_shared_image(shared_planes)
+            preprocessed = planes[:, y_start:y_end, x_start:x_end]
+        elif cache is not None:
+            # Серое изображение и CLAHE берутся из кэша, если плитку уже обрабатывали
+            cache_dir, cache_size, image_hash = cache
+            key = PreprocessCache.make_key(image_hash, chunk_data, clip_limit, tile_grid_size)
+            with profiling.stage('cache'):
+                preprocessed = PreprocessCache(cache_dir, cache_size).get_or_compute(
+                    key, lambda: preprocess_chunk(img[y_start:y_end, x_start:x_end], clip_limit, tile_grid_size))
+
+        if chunk_data == core:
+            result_chunk, stars = find_stars_in_chunk(img, chunk_data, threshold, clip_limit,
+                                                      tile_grid_size, preprocessed)
+        else:
+            # Плитки перекрываются, поэтому рисуем в копии, а не в общем буфере соседей
+            with profiling.stage('copy_tile', (y_end - y_start) * (x_end - x_start) * 3):
+                tile = img[y_start:y_end, x_start:x_end].copy()
+            result_tile, stars = find_stars_in_chunk(tile, (0, 0, x_end - x_start, y_end - y_start), threshold,
+                                                     clip_limit, tile_grid_size, preprocessed)
+            result_chunk = result_tile[core[1] - y_start:core[3] - y_start,
+                                       core[0] - x_start:core[2] - x_start]
+
+        if shared_output is not None:
+            # Разметка сразу попадает в общий холст, родителю возвращаются только рамки
+            out_shm, canvas = attach_shared_image(shared_output)
+            with profiling.stage('canvas', result_chunk.nbytes):
+                canvas[core[1]:core[3], core[0]:core[2]] = result_chunk
+
+        if save_chunks:
+            output_path = os.path.join(output_folder, f"output_{os.path.basename(image_path)}_{chunk_index}.png")
+            with profiling.stage('write_chunk', result_chunk.nbytes):
+                cv2.imwrite(output_path, result_chunk)
+    finally:
+        # view должны быть освобождены до закрытия буфера
+        img = result_chunk = canvas = planes = preprocessed = None
+        if shm is not None:
+            shm.close()
+        if out_shm is not None:
+            out_shm.close()
+        if planes_shm is not None:
+            planes_shm.close()
+
+    # Звезду из зоны перекрытия учитывает только плитка, которой принадлежит ее центр
+    stars = select_owned(stars, x_start, y_start, core)
+    stars['chunk'] = chunk_index
+
+    events = []
+    if profile:
+        # Задача целиком - отдельное событие, по нему видно расписание пула
+        profiling.record('task', task_start, image=os.path.basename(image_path), chunk=chunk_index)
+        events = profiling.drain()
+        profiling.disable()
+
+    return {"image_path": image_path, "chunk_index": chunk_index, "core": core,
+            "output_path": output_path, "stars": stars, "events": events}
+
+
+def preprocess_chunk(chunk, clip_limit=CLIP_LIMIT, tile_grid_size=TILE_GRID_SIZE, out=None):
+    # Серое изображение и CLAHE пишутся прямо в out (2, высота, ширина), без промежуточных копий
+    if out is None:
+        out = np.empty((2, *chunk.shape[:2]), dtype=np.uint8)
+    gray, enhanced = out
 
-    return {"chunk_index": chunk_index, "output_path": output_path, "obj_locations": obj_locations}
+    # Преобразование изображения в оттенки серого
+    with profiling.stage('grayscale', chunk.nbytes):
+        cv2.cvtColor(chunk, cv2.COLOR_BGR2GRAY, dst=gray)
+
+    # Применение фильтра для улучшения контраста
+    with profiling.stage('clahe', gray.nbytes):
+        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid_size))
+        clahe.apply(gray, dst=enhanced)
 
+    return out
 
 
-def find_stars_in_chunk(image, chunk_data):
+def find_stars_in_chunk(image, chunk_data, threshold=THRESHOLD, clip_limit=CLIP_LIMIT,
+                        tile_grid_size=TILE_GRID_SIZE, preprocessed=None):
     x_start, y_start, x_end, y_end = chunk_data
     chunk = image[y_start:y_end, x_start:x_end]
 
-    # Преобразование изображения в оттенки серого
-    gray = cv2.cvtColor(chunk, cv2.COLOR_BGR2GRAY)
-
-    # Применение фильтра для улучшения контраста
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    enhanced = clahe.apply(gray)
+    if preprocessed is None:
+        preprocessed = preprocess_chunk(chunk, clip_limit, tile_grid_size)
+    gray, enhanced = preprocessed
 
     # Применение алгоритма выделения звезд
-    _, thresholded = cv2.threshold(enhanced, 200, 255, cv2.THRESH_BINARY)
+    with profiling.stage('threshold', enhanced.nbytes):
+        _, thresholded = cv2.threshold(enhanced, threshold, 255, cv2.THRESH_BINARY)
 
     # Нахождение контуров
-    contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    with profiling.stage('contours', thresholded.nbytes):
+        contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    with profiling.stage('draw', chunk.nbytes):
+        cv2.drawContours(chunk, contours, -1, (0, 255, 0), 2)
+
+    # Рамки, центры, площади и потоки всех звезд считаются одним проходом
+    with profiling.stage('measure', thresholded.nbytes):
+        stars = measure_stars(thresholded, gray)
 
-    for contour in contours:
-        cv2.drawContours(chunk, [contour], 0, (0, 255, 0), 2)
+    return chunk, stars
 
-    return chunk, contours
+
+def get_image_size(image_path):
+    # PIL читает только заголовок, пиксели не декодируются
+    with Image.open(image_path) as img:
+        return img.size
 
 
 def divide_image(image_path, num_chunks):
-    img = Image.open(image_path)
-    width, height = img.size
+    width, height = get_image_size(image_path)
     chunk_size = width // num_chunks
 
     chunks = []
@@ -62,66 +174,436 @@ def divide_image(image_path, num_chunks):
         x_end = (i + 1) * chunk_size if i < num_chunks - 1 else width
         chunks.append((x_start, 0, x_end, height))
 
-    return [(image_path, i, chunk) for i, chunk in enumerate(chunks)]
+    return [(image_path, i, chunk, chunk) for i, chunk in enumerate(chunks)]
+
+
+def choose_tile_size(width, height, num_processes, tiles_per_process=4):
+    # Несколько плиток на процесс для балансировки, сторона кратна 64 и лежит в [256, 4096]
+    side = int(np.sqrt(width * height / (num_processes * tiles_per_process)))
+    side = max(256, min(4096, side))
+    return side - side % 64
+
+
+def divide_image_tiles(image_path, tile_size=None, overlap=32, num_processes=None):
+    '''
+    Splits image into square tiles. Each tile owns its core region and is
+    processed together with an overlap margin, so stars smaller than the
+    overlap are always found whole by the tile that owns their center.
+    Tiles are thresholded on gray/CLAHE planes of the whole image (see
+    preprocess_to_shared_memory), which makes the catalog equal to a single pass.
+    '''
+    width, height = get_image_size(image_path)
+    if tile_size is None:
+        tile_size = choose_tile_size(width, height, num_processes or multiprocessing.cpu_count())
+
+    tiles = []
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            core = (x, y, min(x + tile_size, width), min(y + tile_size, height))
+            padded = (max(x - overlap, 0), max(y - overlap, 0),
+                      min(core[2] + overlap, width), min(core[3] + overlap, height))
+            tiles.append((image_path, len(tiles), padded, core))
+
+    return tiles
+
+
+def create_shared_image(shape, dtype):
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+    return shm, (shm.name, tuple(shape), dtype.str)
+
+
+def attach_shared_image(shared_image):
+    shm_name, shape, dtype = shared_image
+    shm = shared_memory.SharedMemory(name=shm_name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def load_image_to_shared_memory(image_path):
+    with profiling.stage('decode', os.path.getsize(image_path)):
+        img = cv2.imread(image_path)
+    shm, shared_image = create_shared_image(img.shape, img.dtype)
+    with profiling.stage('copy_shared', img.nbytes):
+        np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[:] = img
+    return shm, shared_image
+
+
+def preprocess_to_shared_memory(image_path, img=None, clip_limit=CLIP_LIMIT, tile_grid_size=TILE_GRID_SIZE,
+                                cache=None):
+    '''
+    Writes gray and CLAHE planes of the whole image straight into a new
+    shared memory block. CLAHE of a pixel depends on the histograms of
+    neighbouring grid cells of the whole image, so per-tile CLAHE would find
+    a different set of stars. The price is that this stage runs once in the
+    parent, outside the pool (OpenCV still spreads it over its own threads):
+    about 8 ms per megapixel on one core, a quarter of a single-pass run on
+    the bench.py star field. Without `img` the image is decoded here once
+    more, on top of the decoding in every worker.
+    '''
+    if img is not None:
+        height, width = img.shape[:2]
+    else:
+        width, height = get_image_size(image_path)
+    shm, shared_planes = create_shared_image((2, height, width), np.uint8)
+    planes = np.ndarray(shared_planes[1], dtype=np.uint8, buffer=shm.buf)
+    try:
+        cached = key = None
+        if cache is not None:
+            cache_dir, cache_size, image_hash = cache
+            key = PreprocessCache.make_key(image_hash, (0, 0, width, height), clip_limit, tile_grid_size)
+            with profiling.stage('cache'):
+                cached = PreprocessCache(cache_dir, cache_size).get(key)
+
+        if cached is not None:
+            with profiling.stage('copy_shared', cached.nbytes):
+                planes[:] = cached
+        else:
+            if img is None:
+                with profiling.stage('decode', os.path.getsize(image_path)):
+                    img = cv2.imread(image_path)
+            preprocess_chunk(img, clip_limit, tile_grid_size, out=planes)
+            if key is not None:
+                with profiling.stage('cache'):
+                    PreprocessCache(cache_dir, cache_size).put(key, planes)
+    except BaseException:
+        # view должен быть освобожден до закрытия буфера
+        planes = None
+        release_shared_blocks([shm])
+        raise
+    return shm, shared_planes
+
+
+def report_usage(label, start_time):
+    # ru_maxrss в Linux измеряется в КБ; для детей берется максимум по завершенным воркерам
+    parent_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    worker_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"{label}: wall time {time.perf_counter() - start_time:.2f} s, "
+          f"peak RSS parent {parent_rss:.1f} MB, worker {worker_rss:.1f} MB")
+
+
+def prepare_image_tasks(image_path, output_folder, num_processes, num_chunks_per_image=None,
+                        use_shared_memory=False, tile_size=None, overlap=32, save_chunks=False,
+                        detection=None, cache=None, profile=False):
+    '''
+    Allocates shared buffers for one image and builds its worker tasks.
+    Returns the shared memory blocks, a view of the output canvas and the tasks.
+    '''
+    shared_blocks = []
+    shared_image = img = None
+    if use_shared_memory:
+        shm, shared_image = load_image_to_shared_memory(image_path)
+        shared_blocks.append(shm)
+        img = np.ndarray(shared_image[1], dtype=shared_image[2], buffer=shm.buf)
+        height, width = shared_image[1][:2]
+    else:
+        width, height = get_image_size(image_path)
 
+    # Общий холст результата, в который воркеры пишут свои плитки
+    shm, shared_output = create_shared_image((height, width, 3), np.uint8)
+    shared_blocks.append(shm)
+    canvas = np.ndarray(shared_output[1], dtype=np.uint8, buffer=shm.buf)
 
-def parallel_process_images(image_paths, output_folder, 
-                            num_processes, num_chunks_per_image):
-    with multiprocessing.Pool(processes=num_processes) as pool:
-        results = pool.starmap(process_image_chunk, [(chunk, output_folder) for image_path in image_paths
-                                                      for chunk in divide_image(image_path, num_chunks_per_image)])
-
-    obj_locations = []
-    img_results = []
-    for result in results:
-        print(f"Chunk: {result['chunk_index']}, Output: {result['output_path']}")
-        img = cv2.imread(result['output_path'])
-        if not(img_results) or img.shape == img_results[0].shape and img.dtype == img_results[0].dtype:
-            img_results.append(img)
-        else:
-            print(f"Skipping {result['output_path']} due to different size or data type.")
-        obj_locations += [(os.path.basename(result['output_path']), loc) for loc in result['obj_locations']]
-    
+    if cache is not None:
+        cache = (*cache, image_content_hash(image_path))
+
+    shared_planes = None
+    if num_chunks_per_image:
+        chunks = divide_image(image_path, num_chunks_per_image)
+    else:
+        chunks = divide_image_tiles(image_path, tile_size, overlap, num_processes)
+        # Плитки перекрываются и не совпадают с сеткой CLAHE, поэтому контраст
+        # считается один раз для всего изображения и раздается через общую память
+        _, clip_limit, tile_grid_size = detection or (THRESHOLD, CLIP_LIMIT, TILE_GRID_SIZE)
+        shm, shared_planes = preprocess_to_shared_memory(image_path, img, clip_limit, tile_grid_size, cache)
+        shared_blocks.append(shm)
+    img = None
+
+    tasks = [(chunk, output_folder, shared_image, shared_output, save_chunks, detection, cache, profile,
+              shared_planes)
+             for chunk in chunks]
 
-    result = cv2.hconcat(img_results)
+    return shared_blocks, canvas, tasks
 
-    output_path = os.path.join(output_folder, 'result.jpg')
-    cv2.imwrite(output_path, result)
-    print(f"Result saved to {output_path}")
 
-    cv2.imshow('Result', result)
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+def task_cost(task):
+    x_start, y_start, x_end, y_end = task[0][2]
+    return (x_end - x_start) * (y_end - y_start)
 
-    # Сохранение местоположения объектов в файл
-    n_elements = 0
-    with open(os.path.join(output_folder, 'obj_locations.txt'), 'w') as f:
-        for image_path, loc in obj_locations:
-            f.write(f"{os.path.basename(image_path)}: x={loc[0]}, y={loc[1]}, w={loc[2]}, h={loc[3]}\n")
-            n_elements += 1
-    print(f"Object locations saved to {os.path.join(output_folder, 'obj_locations.txt')}")
+
+def schedule_batches(tasks, num_processes, batches_per_process=8):
+    '''
+    Orders tasks largest-first and packs them into batches of similar cost:
+    big tiles go alone so they start early, small ones are grouped to save
+    round trips to the pool.
+    '''
+    tasks = sorted(tasks, key=task_cost, reverse=True)
+    target = sum(map(task_cost, tasks)) / (num_processes * batches_per_process)
+
+    batches = []
+    batch, batch_cost = [], 0
+    for task in tasks:
+        batch.append(task)
+        batch_cost += task_cost(task)
+        if batch_cost >= target:
+            batches.append(batch)
+            batch, batch_cost = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def process_chunk_batch(batch):
+    return [process_image_chunk(*task) for task in batch]
+
+
+def submit_tasks(pool, tasks, num_processes):
+    # Пул раздает пакеты освободившимся воркерам, результаты приходят по мере готовности
+    return pool.imap_unordered(process_chunk_batch, schedule_batches(tasks, num_processes))
+
+
+def release_shared_blocks(shared_blocks):
+    # Все view на буферы должны быть освобождены заранее
+    for shm in shared_blocks:
+        shm.close()
+        shm.unlink()
+
+
+def parallel_process_images(image_paths, output_folder, 
+                            num_processes, num_chunks_per_image=None, use_shared_memory=False,
+                            tile_size=None, overlap=32, save_chunks=False, show=True, export_text=False,
+                            threshold=THRESHOLD, clip_limit=CLIP_LIMIT, tile_grid_size=TILE_GRID_SIZE,
+                            cache_dir=None, cache_size=CACHE_SIZE, profile=False, dynamic_scheduling=True):
+    start_time = time.perf_counter()
+    if profile:
+        profiling.enable()
+    detection = (threshold, clip_limit, tile_grid_size)
+    cache = (cache_dir, cache_size) if cache_dir else None
+
+    shared_blocks = []
+    canvases = {}
+    try:
+        tasks = []
+        for image_path in image_paths:
+            image_blocks, canvases[image_path], image_tasks = prepare_image_tasks(
+                image_path, output_folder, num_processes, num_chunks_per_image,
+                use_shared_memory, tile_size, overlap, save_chunks, detection, cache, profile)
+            shared_blocks += image_blocks
+            tasks += image_tasks
+
+        with multiprocessing.Pool(processes=num_processes) as pool:
+            if dynamic_scheduling:
+                results = [result for batch in submit_tasks(pool, tasks, num_processes) for result in batch]
+                results.sort(key=lambda result: result['chunk_index'])
+            else:
+                results = pool.starmap(process_image_chunk, tasks)
+
+        stars_by_image = {image_path: [] for image_path in canvases}
+        for result in results:
+            if result['output_path']:
+                print(f"Chunk: {result['chunk_index']}, Output: {result['output_path']}")
+            stars_by_image[result['image_path']].append(result['stars'])
+
+        img_results = []
+        for image_path, img in canvases.items():
+            if not(img_results) or img.shape[0] == img_results[0].shape[0]:
+                img_results.append(img)
+            else:
+                print(f"Skipping {image_path} due to different size.")
+
+        result = img_results[0] if len(img_results) == 1 else cv2.hconcat(img_results)
+
+        # Итоговое изображение кодируется один раз
+        output_path = os.path.join(output_folder, 'result.jpg')
+        with profiling.stage('encode', result.nbytes):
+            cv2.imwrite(output_path, result)
+        print(f"Result saved to {output_path}")
+        report_usage("shared memory" if use_shared_memory else "per-chunk imread", start_time)
+
+        if show:
+            cv2.imshow('Result', result)
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()
+    finally:
+        img = result = img_results = None
+        canvases.clear()
+        release_shared_blocks(shared_blocks)
+
+    n_elements = save_stars(output_folder, list(stars_by_image),
+                            [np.concatenate(stars) for stars in stars_by_image.values()], export_text)
+
+    if profile:
+        save_profile(output_folder, profiling.drain() + [event for result in results for event in result['events']])
+        profiling.disable()
 
     return results, n_elements
 
 
+def save_stars(output_folder, image_paths, stars_per_image, export_text=False):
+    # Сохранение местоположения объектов в каталог и, по желанию, в текстовый файл
+    catalog_path = os.path.join(output_folder, 'catalog.npz')
+    save_catalog(catalog_path, image_paths, stars_per_image)
+    print(f"Star catalog saved to {catalog_path}")
+
+    if export_text:
+        locations_path = os.path.join(output_folder, 'obj_locations.txt')
+        write_obj_locations(locations_path, image_paths, stars_per_image)
+        print(f"Object locations saved to {locations_path}")
+
+    return sum(len(stars) for stars in stars_per_image)
+
+
+def save_profile(output_folder, events):
+    summary = profiling.summarize(events)
+    profiling.print_summary(summary)
+
+    with open(os.path.join(output_folder, 'profile_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=4)
+    trace_path = os.path.join(output_folder, 'trace.json')
+    profiling.write_chrome_trace(trace_path, events)
+    print(f"Profile trace saved to {trace_path}")
+
+
+def detect_stars(image_paths, output_folder="result/", num_processes=None, num_chunks_per_image=None,
+                 use_shared_memory=True, tile_size=None, overlap=32, save_chunks=False, prefetch=2,
+                 threshold=THRESHOLD, clip_limit=CLIP_LIMIT, tile_grid_size=TILE_GRID_SIZE,
+                 cache_dir=None, cache_size=CACHE_SIZE, profile=False):
+    '''
+    Processes a batch of images on one persistent worker pool and yields a
+    result per image, in input order, as soon as it is done. Up to
+    `prefetch` images are decoded and queued ahead so the pool does not
+    idle between images. With `profile` each result also carries the
+    stage events recorded for it by the workers and the parent.
+    '''
+    num_processes = num_processes or multiprocessing.cpu_count()
+    detection = (threshold, clip_limit, tile_grid_size)
+    cache = (cache_dir, cache_size) if cache_dir else None
+    image_paths = iter(image_paths)
+    pending = deque()
+    # Буферы создаются уже после запуска пула: воркеры должны делить трекер ресурсов
+    # с родителем, иначе их собственный трекер удалит сегменты при выходе воркера
+    resource_tracker.ensure_running()
+    if profile:
+        profiling.enable()
+    try:
+        with multiprocessing.Pool(processes=num_processes) as pool:
+            while True:
+                while len(pending) < prefetch:
+                    image_path = next(image_paths, None)
+                    if image_path is None:
+                        break
+                    shared_blocks, canvas, tasks = prepare_image_tasks(
+                        image_path, output_folder, num_processes, num_chunks_per_image,
+                        use_shared_memory, tile_size, overlap, save_chunks, detection, cache, profile)
+                    pending.append((image_path, shared_blocks, canvas,
+                                    submit_tasks(pool, tasks, num_processes)))
+                    canvas = None
+                if not pending:
+                    break
+
+                image_path, shared_blocks, canvas, batches = pending[0]
+                results = sorted((result for batch in batches for result in batch),
+                                 key=lambda result: result['chunk_index'])
+                result_path = os.path.join(output_folder, f"result_{os.path.basename(image_path)}")
+                with profiling.stage('encode', canvas.nbytes):
+                    cv2.imwrite(result_path, canvas)
+                canvas = None
+                pending.popleft()
+                release_shared_blocks(shared_blocks)
+
+                yield {"image_path": image_path, "result_path": result_path,
+                       "stars": np.concatenate([result['stars'] for result in results]),
+                       "events": profiling.drain() + [event for result in results for event in result['events']]}
+    finally:
+        # Генератор могли закрыть раньше времени: пул уже остановлен, буферы можно освобождать
+        canvas = None
+        blocks = [block for _, shared_blocks, _, _ in pending for block in shared_blocks]
+        pending.clear()
+        release_shared_blocks(blocks)
+        if profile:
+            profiling.disable()
+
+
+def expand_image_paths(patterns):
+    image_paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            image_paths += sorted(path for path in glob.glob(os.path.join(pattern, '*'))
+                                  if path.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            image_paths += sorted(glob.glob(pattern))
+    return image_paths
+
+
+def run_cli(argv):
+    parser = argparse.ArgumentParser(description="Find stars in images without GUI")
+    parser.add_argument('paths', nargs='+', help="image files, directories or glob patterns")
+    parser.add_argument('-o', '--output', default="result/", help="output folder")
+    parser.add_argument('-p', '--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--chunks', type=int, default=None, help="vertical strips per image instead of tiles")
+    parser.add_argument('--tile-size', type=int, default=None)
+    parser.add_argument('--overlap', type=int, default=32)
+    parser.add_argument('--save-chunks', action='store_true')
+    parser.add_argument('--text', action='store_true', help="also export obj_locations.txt")
+    parser.add_argument('--threshold', type=int, default=THRESHOLD)
+    parser.add_argument('--clip-limit', type=float, default=CLIP_LIMIT)
+    parser.add_argument('--tile-grid', type=int, nargs=2, default=TILE_GRID_SIZE, metavar=('COLS', 'ROWS'))
+    parser.add_argument('--cache-dir', default=None, help="reuse gray/CLAHE tiles between runs")
+    parser.add_argument('--cache-size-mb', type=int, default=CACHE_SIZE >> 20)
+    parser.add_argument('--profile', action='store_true', help="write per-stage summary and trace.json")
+    args = parser.parse_args(argv)
+
+    image_paths = expand_image_paths(args.paths)
+    if not image_paths:
+        sys.exit("No images found")
+    os.makedirs(args.output, exist_ok=True)
+
+    finished_paths = []
+    stars_per_image = []
+    events = []
+    for result in detect_stars(image_paths, args.output, args.processes, args.chunks,
+                               tile_size=args.tile_size, overlap=args.overlap,
+                               save_chunks=args.save_chunks, threshold=args.threshold,
+                               clip_limit=args.clip_limit, tile_grid_size=tuple(args.tile_grid),
+                               cache_dir=args.cache_dir, cache_size=args.cache_size_mb << 20,
+                               profile=args.profile):
+        finished_paths.append(result['image_path'])
+        events += result['events']
+        stars_per_image.append(result['stars'])
+        print(f"{result['image_path']}: {len(result['stars'])} objects, "
+              f"result saved to {result['result_path']}")
+
+    n_elements = save_stars(args.output, finished_paths, stars_per_image, args.text)
+    if args.profile:
+        save_profile(args.output, events)
+    print(f"Found {n_elements} objects")
+
 
 def find_btn():
     output_folder = "result/"
     num_processes = multiprocessing.cpu_count()
 
-    if chunks_entry.get():
-        chunks = int(chunks_entry.get())
-    else:
-         chunks = 20
+    # Без числа полос изображение режется на квадратные плитки автоматически
+    chunks = int(chunks_entry.get()) if chunks_entry.get() else None
+    threshold = int(threshold_entry.get()) if threshold_entry.get() else THRESHOLD
 
     images = fd.askopenfilenames(filetypes=[('jpg', '*.jpg')])
 
-    results, n_elements = parallel_process_images(images, output_folder, num_processes, chunks)
+    results, n_elements = parallel_process_images(images, output_folder, num_processes, chunks,
+                                                  use_shared_memory=shared_memory_var.get(),
+                                                  save_chunks=save_chunks_var.get(),
+                                                  export_text=export_text_var.get(),
+                                                  threshold=threshold)
     n_elements_label.config(text=f"Found {n_elements} objects")
 
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run_cli(sys.argv[1:])
+        sys.exit()
+    if tk is None:
+        sys.exit(f"tkinter is not available, run headless: {sys.argv[0]} IMAGES...")
+
     root = tk.Tk()
     root.geometry('200x200')
     root.title("find obj")
@@ -131,6 +613,23 @@ if __name__ == "__main__":
     chunks_entry = tk.Entry(root)
     chunks_entry.grid(row=1, column=2)
 
+    threshold_label = tk.Label(root, text="threshold")
+    threshold_label.grid(row=6, column=1)
+    threshold_entry = tk.Entry(root)
+    threshold_entry.grid(row=6, column=2)
+
+    shared_memory_var = tk.BooleanVar(value=True)
+    shared_memory_check = tk.Checkbutton(root, text="shared memory", variable=shared_memory_var)
+    shared_memory_check.grid(row=2, column=1, columnspan=2)
+
+    save_chunks_var = tk.BooleanVar(value=False)
+    save_chunks_check = tk.Checkbutton(root, text="save chunks", variable=save_chunks_var)
+    save_chunks_check.grid(row=3, column=2)
+
+    export_text_var = tk.BooleanVar(value=False)
+    export_text_check = tk.Checkbutton(root, text="obj_locations.txt", variable=export_text_var)
+    export_text_check.grid(row=5, column=1, columnspan=2)
+
     n_elements_label = tk.Label(root, text="")
     n_elements_label.grid(row=4, column=1)
 
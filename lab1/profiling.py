@@ -0,0 +1,112 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+
+# События текущего процесса; None - запись выключена и stage() ничего не стоит.
+# Воркеры, созданные через fork, наследуют список родителя, поэтому он привязан к pid
+_events = None
+_pid = None
+
+
+def enable():
+    global _events, _pid
+    if not enabled():
+        _events = []
+        _pid = os.getpid()
+
+
+def disable():
+    global _events
+    _events = None
+
+
+def enabled():
+    return _events is not None and _pid == os.getpid()
+
+
+def drain():
+    '''
+    Returns events recorded so far in this process and starts a new list.
+    '''
+    global _events
+    if not enabled():
+        return []
+    events, _events = _events, []
+    return events
+
+
+def now():
+    # CLOCK_MONOTONIC общий для всех процессов, поэтому события воркеров сравнимы
+    return time.perf_counter_ns()
+
+
+def record(name, start_ns, nbytes=0, **args):
+    if not enabled():
+        return
+    _events.append({
+        'name': name,
+        'pid': os.getpid(),
+        'ts': start_ns // 1000,
+        'dur': (now() - start_ns) // 1000,
+        'bytes': nbytes,
+        'args': args,
+    })
+
+
+@contextmanager
+def stage(name, nbytes=0, **args):
+    if not enabled():
+        yield
+        return
+    start = now()
+    try:
+        yield
+    finally:
+        record(name, start, nbytes, **args)
+
+
+def summarize(events):
+    '''
+    Aggregates events by stage: count, total/mean/max time and throughput.
+    '''
+    summary = {}
+    for event in events:
+        stats = summary.setdefault(event['name'], {'count': 0, 'total_s': 0.0, 'max_ms': 0.0, 'bytes': 0})
+        stats['count'] += 1
+        stats['total_s'] += event['dur'] / 1e6
+        stats['max_ms'] = max(stats['max_ms'], event['dur'] / 1e3)
+        stats['bytes'] += event['bytes']
+
+    for stats in summary.values():
+        stats['mean_ms'] = stats['total_s'] * 1e3 / stats['count']
+        stats['mb_per_s'] = stats['bytes'] / 2**20 / stats['total_s'] if stats['total_s'] else 0.0
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'stage':<12}{'count':>7}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'MB/s':>10}")
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]['total_s']):
+        print(f"{name:<12}{stats['count']:>7}{stats['total_s']:>10.3f}{stats['mean_ms']:>10.2f}"
+              f"{stats['max_ms']:>10.2f}{stats['mb_per_s']:>10.1f}")
+
+
+def write_chrome_trace(path, events):
+    '''
+    Writes events in Chrome trace format (chrome://tracing, ui.perfetto.dev):
+    one row per process, so the pool schedule is visible as a timeline.
+    '''
+    origin = min((event['ts'] for event in events), default=0)
+    trace = [{
+        'name': event['name'],
+        'ph': 'X',
+        'ts': event['ts'] - origin,
+        'dur': event['dur'],
+        'pid': event['pid'],
+        'tid': event['pid'],
+        'args': {'bytes': event['bytes'], **event['args']},
+    } for event in events]
+
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
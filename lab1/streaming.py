@@ -0,0 +1,128 @@
+import os
+import sys
+import numpy as np
+import cv2
+
+from main import find_stars_in_chunk, save_stars, THRESHOLD, CLIP_LIMIT, TILE_GRID_SIZE
+from catalog import select_owned
+
+
+class BandReader:
+    '''
+    Reads horizontal bands of an image stored as raw rows on disk.
+    Rows are read with plain file reads, so nothing but the requested band
+    stays resident. Supported inputs: .npy, raw BGR bytes (shape must be
+    given) and uncompressed TIFF (memory-mapped, requires tifffile).
+    '''
+    def __init__(self, image_path, shape=None):
+        self.__file = None
+        self.__tiff = None
+        ext = os.path.splitext(image_path)[1].lower()
+        if ext in ('.tif', '.tiff'):
+            try:
+                import tifffile
+            except ImportError:
+                raise RuntimeError("tifffile is required for streaming TIFF input")
+            self.__tiff = tifffile.memmap(image_path, mode='r')
+            self.__shape = self.__tiff.shape
+            return
+
+        self.__file = open(image_path, 'rb')
+        if ext == '.npy':
+            version = np.lib.format.read_magic(self.__file)
+            read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran_order, dtype = read_header(self.__file)
+            if fortran_order or dtype != np.uint8:
+                raise ValueError(f"{image_path} must be a C-ordered uint8 array")
+        elif shape is None:
+            raise ValueError(f"Shape (height, width[, channels]) is required for raw input {image_path}")
+        self.__shape = tuple(shape)
+        self.__offset = self.__file.tell()
+        self.__row_size = int(np.prod(self.__shape[1:]))
+
+    @property
+    def shape(self):
+        return self.__shape
+
+    def read(self, start, end):
+        if self.__tiff is not None:
+            return np.array(self.__tiff[start:end])
+        self.__file.seek(self.__offset + start * self.__row_size)
+        rows = np.fromfile(self.__file, dtype=np.uint8, count=(end - start) * self.__row_size)
+        return rows.reshape((end - start,) + self.__shape[1:])
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+
+
+def choose_band_height(width, memory_budget, overlap):
+    # В памяти одновременно окно, его размеченная копия и серые промежуточные массивы
+    band_height = memory_budget // (width * 3 * 3) - 2 * overlap
+    return max(64, band_height)
+
+
+def stream_process_image(image_path, output_folder, shape=None, band_height=None,
+                         overlap=32, memory_budget=256 * 1024 * 1024, export_text=False,
+                         threshold=THRESHOLD, clip_limit=CLIP_LIMIT, tile_grid_size=TILE_GRID_SIZE):
+    '''
+    Finds stars band by band. Each band is processed together with `overlap`
+    rows of context on both sides; the rows shared with the previous band
+    are carried over instead of being read twice. A star is reported by the
+    band that owns the row of its center, and annotated rows are appended
+    to an .npy file as soon as their band is done.
+    '''
+    reader = BandReader(image_path, shape)
+    height, width = reader.shape[:2]
+    if band_height is None:
+        band_height = choose_band_height(width, memory_budget, overlap)
+
+    name = os.path.basename(image_path)
+    output_path = os.path.join(output_folder, f"result_{os.path.splitext(name)[0]}.npy")
+
+    band_stars = []
+    carry = np.empty((0, width, 3), dtype=np.uint8)
+    window_start = 0
+    with open(output_path, 'wb') as output:
+        np.lib.format.write_array_header_1_0(
+            output, {'descr': np.dtype(np.uint8).str, 'fortran_order': False, 'shape': (height, width, 3)})
+        for band_index, core_start in enumerate(range(0, height, band_height)):
+            core_end = min(core_start + band_height, height)
+            read_start = window_start + len(carry)
+            read_end = min(core_end + overlap, height)
+
+            rows = reader.read(read_start, read_end)
+            if rows.ndim == 2:
+                rows = cv2.cvtColor(rows, cv2.COLOR_GRAY2BGR)
+            window = np.concatenate((carry, rows))
+
+            # Рисуем в копии, чтобы перенесенные строки остались нетронутыми
+            annotated, stars = find_stars_in_chunk(window.copy(), (0, 0, width, len(window)),
+                                                   threshold, clip_limit, tile_grid_size)
+
+            # Звезду на границе полос учитывает полоса, которой принадлежит ее центр
+            stars = select_owned(stars, 0, window_start, (0, core_start, width, core_end))
+            stars['chunk'] = band_index
+            band_stars.append(stars)
+
+            annotated[core_start - window_start:core_end - window_start].tofile(output)
+
+            next_start = max(core_end - overlap, 0)
+            carry = window[next_start - window_start:]
+            window_start = next_start
+
+    reader.close()
+    print(f"Result saved to {output_path}")
+
+    return save_stars(output_folder, [image_path], [np.concatenate(band_stars)], export_text)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit(f"Usage: {sys.argv[0]} IMAGE OUTPUT_FOLDER [HEIGHT WIDTH]")
+
+    raw_shape = (int(sys.argv[3]), int(sys.argv[4]), 3) if len(sys.argv) >= 5 else None
+    os.makedirs(sys.argv[2], exist_ok=True)
+    n_elements = stream_process_image(sys.argv[1], sys.argv[2], shape=raw_shape)
+    print(f"Found {n_elements} objects")
@@ -0,0 +1,116 @@
+'''
+Throughput of the chat server send path over real sockets. The server runs
+in its own process; receivers and senders share one room and every message
+is delivered to every member. Each configuration is run with separate
+writes per message and with coalesced writes, on every event loop given.
+
+Usage: python bench.py [--room-sizes 10 100] [--messages 2000] [--senders 4] [--loops asyncio uvloop]
+'''
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import socket
+import sys
+import time
+from history import RoomHistory
+from protocol import open_stream
+from runtime import uvloop
+from server import Server
+
+
+def run_server(port: int, coalesce: bool, loop: str = 'asyncio'):
+    server = Server('127.0.0.1', port, max_queued=1 << 20, history=RoomHistory(0), coalesce=coalesce)
+    server.logger.setLevel(logging.WARNING)
+    server.start_server(loop)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def connect(port: int, room: str):
+    for _ in range(100):
+        try:
+            stream = await open_stream('127.0.0.1', port)
+            break
+        except OSError:
+            # Сервер еще запускается
+            await asyncio.sleep(0.05)
+    await stream.read()
+    stream.write(f"/join {room}".encode('utf8'))
+    await stream.drain()
+    await stream.read()
+    return stream
+
+
+async def receive(stream, expected: int, idle_timeout: float):
+    received = 0
+    try:
+        while received < expected:
+            if await asyncio.wait_for(stream.read(), idle_timeout) is None:
+                break
+            received += 1
+    except asyncio.TimeoutError:
+        pass
+    return received
+
+
+async def send(stream, n_messages: int):
+    for i in range(n_messages):
+        stream.write(f"message {i}".encode('utf8'))
+        if i % 64 == 63:
+            await stream.drain()
+    await stream.drain()
+
+
+async def run_room(port: int, room_size: int, n_senders: int, n_messages: int, idle_timeout: float = 2.0):
+    members = [await connect(port, 'bench') for _ in range(room_size)]
+    expected = n_senders * n_messages
+
+    start = time.perf_counter()
+    receivers = [asyncio.ensure_future(receive(stream, expected, idle_timeout)) for stream in members]
+    await asyncio.gather(*(send(stream, n_messages) for stream in members[:n_senders]))
+    received = await asyncio.gather(*receivers)
+    elapsed = time.perf_counter() - start
+
+    for stream in members:
+        stream.writer.close()
+    # Время ожидания после последнего сообщения не считается, если что-то потерялось
+    if sum(received) < expected * room_size:
+        elapsed -= idle_timeout
+    return expected / elapsed, sum(received) / elapsed, sum(received) / (expected * room_size)
+
+
+def measure(room_size: int, n_senders: int, n_messages: int, coalesce: bool, loop: str = 'asyncio'):
+    port = free_port()
+    server = multiprocessing.Process(target=run_server, args=(port, coalesce, loop), daemon=True)
+    server.start()
+    try:
+        return asyncio.run(run_room(port, room_size, n_senders, n_messages))
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the chat server send path")
+    parser.add_argument('--room-sizes', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--senders', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=2000, help="messages per sender")
+    parser.add_argument('--loops', nargs='+', choices=['asyncio', 'uvloop'],
+                        default=['asyncio', 'uvloop'] if uvloop is not None else ['asyncio'],
+                        help="server event loops to compare")
+    args = parser.parse_args()
+
+    print(f"{'room':>6}{'loop':>9}{'writes':>12}{'messages/s':>12}{'deliveries/s':>14}{'delivered':>11}")
+    for room_size in args.room_sizes:
+        for loop in args.loops:
+            for coalesce in (False, True):
+                messages, deliveries, ratio = measure(room_size, min(args.senders, room_size), args.messages,
+                                                      coalesce, loop)
+                print(f"{room_size:>6}{loop:>9}{'coalesced' if coalesce else 'separate':>12}{messages:>12.0f}"
+                      f"{deliveries:>14.0f}{ratio:>11.0%}")
+                sys.stdout.flush()
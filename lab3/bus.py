@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import socket
+from protocol import MAX_FRAME_SIZE, encode_frame, read_frame
+
+# События шины - JSON-объекты в кадрах protocol.py. Каждое событие воркера
+# концентратор пересылает всем остальным воркерам в порядке получения.
+WORKER_GONE = 'worker-gone'
+# Первое событие нового воркера: остальные в ответ заново публикуют своих клиентов,
+# о подключении которых он не знает
+WORKER_HELLO = 'worker-hello'
+# Экранирование в JSON может увеличить сообщение клиента до 6 раз
+MAX_EVENT_SIZE = 8 * MAX_FRAME_SIZE
+
+
+def bind_hub_socket(path: str):
+    '''
+    Binds the hub's Unix socket before workers are started, so they can
+    connect even if the hub loop is not running yet.
+    '''
+    if os.path.exists(path):
+        os.remove(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen()
+    return sock
+
+
+async def run_hub(sock: socket.socket, stopping: asyncio.Event = None):
+    '''
+    Relays every frame from one worker to all the others. When a worker
+    goes away the others are told to forget its clients. Runs until
+    `stopping` is set, then closes all worker connections.
+    '''
+    writers: dict[asyncio.StreamWriter, int] = {}
+    handlers: set[asyncio.Task] = set()
+
+    def relay(frame: bytes, source: asyncio.StreamWriter):
+        data = encode_frame(frame, MAX_EVENT_SIZE)
+        for writer in writers:
+            if writer is not source:
+                writer.write(data)
+
+    async def handle_worker(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        handlers.add(asyncio.current_task())
+        writers[writer] = None
+        try:
+            while (frame := await read_frame(reader, MAX_EVENT_SIZE)) is not None:
+                if writers[writer] is None:
+                    writers[writer] = json.loads(frame)['worker']
+                relay(frame, writer)
+        except ConnectionError:
+            pass
+        finally:
+            worker = writers.pop(writer)
+            if worker is not None:
+                relay(json.dumps({'op': WORKER_GONE, 'worker': worker}).encode('utf8'), writer)
+            writer.close()
+            handlers.discard(asyncio.current_task())
+
+    server = await asyncio.start_unix_server(handle_worker, sock=sock)
+    async with server:
+        try:
+            if stopping is None:
+                await server.serve_forever()
+            else:
+                await stopping.wait()
+        finally:
+            # Закрытое соединение с концентратором - сигнал воркерам завершаться
+            for writer in list(writers):
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+
+
+class Bus:
+    '''
+    Worker side of the bus: publishes events of this worker and passes
+    events of the other workers to `on_event`. On connect it announces
+    itself with WORKER_HELLO. `on_close` is called if the
+    hub closes the connection.
+    '''
+    def __init__(self, path: str, on_event, on_close=None):
+        self.__path = path
+        self.__on_event = on_event
+        self.__on_close = on_close
+        self.__worker = os.getpid()
+        self.__writer: asyncio.StreamWriter = None
+        self.__task: asyncio.Task = None
+
+    @property
+    def worker(self):
+        return self.__worker
+
+    async def connect(self):
+        reader, self.__writer = await asyncio.open_unix_connection(self.__path)
+        self.__task = asyncio.ensure_future(self.__receive(reader))
+        self.publish(WORKER_HELLO)
+
+    def publish(self, op: str, **event):
+        event = {'op': op, 'worker': self.__worker, **event}
+        self.__writer.write(encode_frame(json.dumps(event).encode('utf8'), MAX_EVENT_SIZE))
+
+    async def __receive(self, reader: asyncio.StreamReader):
+        try:
+            while (frame := await read_frame(reader, MAX_EVENT_SIZE)) is not None:
+                self.__on_event(json.loads(frame))
+        except ConnectionError:
+            pass
+        # Сюда попадаем, только если концентратор пропал: close() отменяет задачу раньше
+        if self.__on_close is not None:
+            self.__on_close()
+
+    def close(self):
+        if self.__task is not None:
+            self.__task.cancel()
+        if self.__writer is not None:
+            self.__writer.close()
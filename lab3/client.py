@@ -1,6 +1,7 @@
 import asyncio
 import sys
 from aioconsole import ainput
+from protocol import MessageStream, open_stream
 
 
 class Client:
@@ -8,8 +9,7 @@ class Client:
         self.__server_ip: str = server_ip
         self.__server_port: int = server_port
         self.__loop: asyncio.AbstractEventLoop = loop
-        self.__reader: asyncio.StreamReader = None
-        self.__writer: asyncio.StreamWriter = None
+        self.__stream: MessageStream = None
 
     @property
     def server_ip(self):
@@ -23,18 +23,21 @@ class Client:
     def loop(self):
         return self.__loop
 
+    @property
+    def stream(self):
+        return self.__stream
+
     @property
     def reader(self):
-        return self.__reader
+        return self.__stream.reader
 
     @property
     def writer(self):
-        return self.__writer
+        return self.__stream.writer
 
     async def connect_to_server(self):
         try:
-            self.__reader, self.__writer = await asyncio.open_connection(
-                self.server_ip, self.server_port)
+            self.__stream = await open_stream(self.server_ip, self.server_port)
             await asyncio.gather(
                 self.receive_messages(),
                 self.start_client_cli()
@@ -54,14 +57,16 @@ class Client:
             self.loop.stop()
 
     async def get_server_message(self):
-        return str((await self.reader.read(255)).decode('utf8'))
+        data = await self.stream.read()
+        # Сервер закрыл соединение
+        return data.decode('utf8') if data is not None else 'quit'
 
     async def start_client_cli(self):
         client_message: str = None
         while client_message != 'quit':
             client_message = await ainput("")
-            self.writer.write(client_message.encode('utf8'))
-            await self.writer.drain()
+            self.stream.write(client_message.encode('utf8'))
+            await self.stream.drain()
 
         if self.loop.is_running():
             self.loop.stop()
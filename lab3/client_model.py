@@ -1,12 +1,21 @@
 import asyncio
+import logging
+import time
+from protocol import MessageStream, accept_stream
+from outbox import Outbox, MAX_QUEUED_MESSAGES, DROP_OLDEST
 
 class Client:
-    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 max_queued: int = MAX_QUEUED_MESSAGES, overflow_policy: str = DROP_OLDEST,
+                 coalesce: bool = True, logger: logging.Logger = None):
         self.__reader: asyncio.StreamReader = reader
         self.__writer: asyncio.StreamWriter = writer
         self.__ip: str = writer.get_extra_info('peername')[0]
         self.__port: int = writer.get_extra_info('peername')[1]
         self.nickname: str = str(writer.get_extra_info('peername'))
+        self.__stream: MessageStream = MessageStream(reader, writer, False)
+        self.__outbox: Outbox = Outbox(writer, max_queued, overflow_policy, coalesce, logger)
+        self.last_active: float = time.monotonic()
 
     def __str__(self):
         return f"{self.nickname} {self.ip}:{self.port}"
@@ -27,5 +36,28 @@ class Client:
     def port(self):
         return self.__port
 
+    @property
+    def outbox(self):
+        return self.__outbox
+
+    @property
+    def framed(self):
+        return self.__stream.framed
+
+    async def negotiate(self):
+        self.__stream = await accept_stream(self.reader, self.writer)
+        self.__outbox.start(self.__stream)
+
     async def get_message(self):
-        return str((await self.reader.read(255)).decode('utf8'))
+        data = await self.__stream.read()
+        self.last_active = time.monotonic()
+        return data.decode('utf8', errors='replace') if data else ''
+
+    def send(self, message: bytes):
+        return self.__outbox.put(message)
+
+    def send_batch(self, messages: list[bytes]):
+        return self.__outbox.put(messages) if messages else True
+
+    def close(self):
+        self.__outbox.close()
@@ -1,48 +1,103 @@
 import asyncio
+import queue
+import threading
 import tkinter as tk
 from tkinter import scrolledtext
+from protocol import open_stream
 
+# Сообщения из сети забираются раз в кадр и вставляются одним вызовом insert
+FRAME_MS = 16
+# Старые строки удаляются, чтобы память и перерисовка не росли с историей
+MAX_LINES = 5000
 
-async def tk_main(root):
-    while True:
-        root.update()
-        await asyncio.sleep(0.05)
 
+class Network(threading.Thread):
+    '''
+    Asyncio side of the client in its own thread. Received messages are put
+    into `incoming`; send() may be called from the Tk thread.
+    '''
+    def __init__(self, host, port, incoming):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.incoming = incoming
+        self.loop = asyncio.new_event_loop()
+        self.stream = None
 
-async def send_message(writer, message):
-    writer.write(message.encode())
-    await writer.drain()
-    text_box.insert(tk.END, "\n" + message)
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.receive_messages())
+        except OSError as e:
+            self.incoming.put(f"Connection failed: {e}")
+        finally:
+            self.incoming.put(None)
+            self.loop.close()
 
+    async def receive_messages(self):
+        self.stream = await open_stream(self.host, self.port)
+        while True:
+            data = await self.stream.read()
+            if data is None:
+                break
+            message = data.decode()
+            self.incoming.put(message)
+            print(message)
 
-async def receive_messages(reader):
-    while True:
-        data = await reader.read(100)
-        if not data:
-            break
-        message = data.decode()
-        text_box.insert(tk.END, "\n" + message)
-        print(message)
+    async def send_message(self, message):
+        if self.stream is None:
+            return
+        self.stream.write(message.encode())
+        await self.stream.drain()
 
+    def send(self, message):
+        asyncio.run_coroutine_threadsafe(self.send_message(message), self.loop)
 
-async def main(root):
-    global writer
-    global reader
-    reader, writer = await asyncio.open_connection('127.0.0.1', 8888)
-    tkmain = asyncio.ensure_future(tk_main(root))
-    await receive_messages(reader)
+    def close(self):
+        if self.stream is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stream.writer.close)
 
 
-def click():
-    asyncio.create_task(send())
+def show_messages(messages):
+    text_box.insert(tk.END, "\n" + "\n".join(messages))
+
+    lines = int(text_box.index('end-1c').split('.')[0])
+    if lines > MAX_LINES:
+        text_box.delete('1.0', f"{lines - MAX_LINES + 1}.0")
+
+
+def poll_messages():
+    messages = []
+    connected = True
+    try:
+        while True:
+            message = incoming.get_nowait()
+            if message is None:
+                connected = False
+                messages.append("Disconnected")
+                break
+            messages.append(message)
+    except queue.Empty:
+        pass
+
+    if messages:
+        show_messages(messages)
+    if connected:
+        root.after(FRAME_MS, poll_messages)
 
 
-async def send():
+def click():
     message = n.get()
-    await send_message(writer, message)
+    network.send(message)
+    show_messages([message])
     n.set("")
 
 
+def close():
+    network.close()
+    root.destroy()
+
+
 if __name__ == "__main__":
     root = tk.Tk()
     root.geometry("800x600")
@@ -54,4 +109,11 @@ if __name__ == "__main__":
     buttn.grid(row=11, column=1)
 
     text_box.grid(row=4, column=1)
-    asyncio.run(main(root))
+
+    incoming = queue.SimpleQueue()
+    network = Network('127.0.0.1', 8888, incoming)
+    network.start()
+
+    root.protocol("WM_DELETE_WINDOW", close)
+    root.after(FRAME_MS, poll_messages)
+    root.mainloop()
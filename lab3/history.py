@@ -0,0 +1,283 @@
+import os
+import time
+import struct
+import asyncio
+from collections import deque, OrderedDict
+
+# Запись лога: время, длина, текст. Запись индекса: смещение записи в сегменте и ее время.
+# Сегмент <первый номер>.log и его индекс <первый номер>.idx только дописываются
+RECORD = struct.Struct('!dI')
+INDEX = struct.Struct('!Qd')
+
+HISTORY_SIZE = 100
+SEGMENT_MESSAGES = 4096
+# Имена комнат задают клиенты: число открытых логов (по два файла) и буферов в памяти ограничено
+MAX_OPEN_LOGS = 64
+MAX_RINGS = 1024
+# Дописанные сообщения сбрасываются на диск не чаще, чем раз в FLUSH_INTERVAL секунд
+FLUSH_INTERVAL = 0.05
+
+
+class RoomLog:
+    '''
+    Append-only segmented log of one room. The index of each segment gives
+    the position of every message, so the tail is read without scanning
+    older history. Appends are buffered until flush(); the log is always
+    flushed before the index, so the index never points past the log.
+    '''
+    def __init__(self, path: str, segment_messages: int = SEGMENT_MESSAGES):
+        self.__path = path
+        self.__segment_messages = segment_messages
+        os.makedirs(path, exist_ok=True)
+
+        self.__pending_index: list[bytes] = []
+        self.__segments = sorted(int(name[:-4]) for name in os.listdir(path) if name.endswith('.log'))
+        if not self.__segments:
+            self.__segments.append(0)
+        index_path = self.segment_path(self.__segments[-1], '.idx')
+        self.__count = os.path.getsize(index_path) // INDEX.size if os.path.exists(index_path) else 0
+        self.__open_segment(self.__segments[-1])
+
+    @property
+    def next_offset(self):
+        return self.__segments[-1] + self.__count
+
+    def segment_path(self, base: int, suffix: str):
+        return os.path.join(self.__path, f"{base:020d}{suffix}")
+
+    def __open_segment(self, base: int):
+        self.__log = open(self.segment_path(base, '.log'), 'ab')
+        self.__index = open(self.segment_path(base, '.idx'), 'ab')
+        self.__index.truncate(self.__count * INDEX.size)
+        if self.__count:
+            # Запись, для которой не успели дописать индекс, отбрасывается
+            with open(self.segment_path(base, '.idx'), 'rb') as f:
+                f.seek((self.__count - 1) * INDEX.size)
+                position, _ = INDEX.unpack(f.read(INDEX.size))
+            with open(self.segment_path(base, '.log'), 'rb') as f:
+                f.seek(position)
+                _, size = RECORD.unpack(f.read(RECORD.size))
+            self.__position = position + RECORD.size + size
+            self.__log.truncate(self.__position)
+        else:
+            self.__position = 0
+            self.__log.truncate(0)
+
+    def append(self, timestamp: float, message: bytes):
+        '''
+        Appends a record; returns True if a new segment was started for it.
+        '''
+        rolled = self.__count >= self.__segment_messages
+        if rolled:
+            self.roll()
+        self.__log.write(RECORD.pack(timestamp, len(message)) + message)
+        self.__pending_index.append(INDEX.pack(self.__position, timestamp))
+        self.__position += RECORD.size + len(message)
+        self.__count += 1
+        return rolled
+
+    def flush(self):
+        if not self.__pending_index:
+            return
+        self.__log.flush()
+        self.__index.write(b''.join(self.__pending_index))
+        self.__index.flush()
+        self.__pending_index.clear()
+
+    def roll(self):
+        base = self.next_offset
+        self.close()
+        self.__segments.append(base)
+        self.__count = 0
+        self.__open_segment(base)
+
+    def segment_count(self, i: int):
+        if i == len(self.__segments) - 1:
+            return self.__count
+        return self.__segments[i + 1] - self.__segments[i]
+
+    def tail(self, n: int):
+        '''
+        Returns up to n last (timestamp, message) records, reading only the
+        segments that hold them.
+        '''
+        self.flush()
+        records = []
+        for i in reversed(range(len(self.__segments))):
+            base = self.__segments[i]
+            count = self.segment_count(i)
+            start = max(0, count - (n - len(records)))
+            if start == count:
+                break
+
+            with open(self.segment_path(base, '.idx'), 'rb') as f:
+                f.seek(start * INDEX.size)
+                position, _ = INDEX.unpack(f.read(INDEX.size))
+            with open(self.segment_path(base, '.log'), 'rb') as f:
+                f.seek(position)
+                data = f.read(self.__position - position if i == len(self.__segments) - 1 else -1)
+
+            segment_records = []
+            offset = 0
+            for _ in range(count - start):
+                timestamp, size = RECORD.unpack_from(data, offset)
+                offset += RECORD.size
+                segment_records.append((timestamp, data[offset:offset + size]))
+                offset += size
+            records[:0] = segment_records
+        return records
+
+    def enforce_retention(self, max_messages: int = None, max_age: float = None):
+        '''
+        Deletes closed segments once all their messages are past the retention
+        limits, so up to one segment more than max_messages may be kept.
+        '''
+        while len(self.__segments) > 1:
+            base, next_base = self.__segments[0], self.__segments[1]
+            expired = max_messages is not None and next_base <= self.next_offset - max_messages
+            if not expired and max_age is not None:
+                with open(self.segment_path(base, '.idx'), 'rb') as f:
+                    f.seek(-INDEX.size, os.SEEK_END)
+                    _, last_timestamp = INDEX.unpack(f.read(INDEX.size))
+                expired = last_timestamp < time.time() - max_age
+            if not expired:
+                break
+            os.remove(self.segment_path(base, '.log'))
+            os.remove(self.segment_path(base, '.idx'))
+            self.__segments.pop(0)
+
+    def close(self):
+        self.flush()
+        self.__log.close()
+        self.__index.close()
+
+
+class RoomHistory:
+    '''
+    Recent messages of every room: an in-memory ring buffer of the last
+    `size` messages per room, optionally backed by a RoomLog per room in
+    `directory`. Retention keeps at most `max_messages` messages on disk
+    and forgets messages older than `max_age` seconds.
+
+    At most `max_open_logs` logs are open and at most `max_rings` rings are
+    kept, the least recently used go first; release() drops both for a room
+    nobody is in. Without a directory a dropped ring is the end of that
+    room's history. Appends reach the disk once per FLUSH_INTERVAL.
+    '''
+    def __init__(self, size: int = HISTORY_SIZE, max_messages: int = None, max_age: float = None,
+                 directory: str = None, segment_messages: int = SEGMENT_MESSAGES,
+                 max_open_logs: int = MAX_OPEN_LOGS, max_rings: int = MAX_RINGS):
+        self.__size = size
+        self.__max_messages = max_messages
+        self.__max_age = max_age
+        self.__directory = directory
+        self.__segment_messages = segment_messages
+        self.__max_open_logs = max_open_logs
+        self.__max_rings = max_rings
+        self.__rings: OrderedDict[str, deque] = OrderedDict()
+        self.__logs: OrderedDict[str, RoomLog] = OrderedDict()
+        self.__unflushed: set[str] = set()
+        self.__flush_handle: asyncio.TimerHandle = None
+
+    def log_path(self, room: str):
+        # Имя комнаты задает пользователь, поэтому в пути оно в hex
+        return os.path.join(self.__directory, room.encode('utf8').hex())
+
+    def log(self, room: str):
+        '''
+        Open log of the room, created if needed. Only the write path opens logs.
+        '''
+        log = self.__logs.get(room)
+        if log is not None:
+            self.__logs.move_to_end(room)
+            return log
+        log = self.__logs[room] = RoomLog(self.log_path(room), self.__segment_messages)
+        log.enforce_retention(self.__max_messages, self.__max_age)
+        if len(self.__logs) > self.__max_open_logs:
+            evicted, old_log = self.__logs.popitem(last=False)
+            self.__unflushed.discard(evicted)
+            old_log.close()
+        return log
+
+    def ring(self, room: str, create: bool = True):
+        '''
+        Ring buffer of the room, loaded from its log on first use. Without
+        `create` a room with no history gets None and nothing is created.
+        '''
+        ring = self.__rings.get(room)
+        if ring is not None:
+            self.__rings.move_to_end(room)
+            return ring
+        if self.__directory is not None and (create or os.path.isdir(self.log_path(room))):
+            records = self.log(room).tail(self.__size)
+        elif create:
+            records = []
+        else:
+            return None
+        ring = self.__rings[room] = deque(records, maxlen=self.__size)
+        if len(self.__rings) > self.__max_rings:
+            self.__rings.popitem(last=False)
+        return ring
+
+    def append(self, room: str, message: bytes):
+        timestamp = time.time()
+        ring = self.ring(room)
+        ring.append((timestamp, message))
+
+        if self.__directory is not None:
+            log = self.log(room)
+            if log.append(timestamp, message):
+                log.enforce_retention(self.__max_messages, self.__max_age)
+            self.__unflushed.add(room)
+            self.schedule_flush()
+
+    def schedule_flush(self):
+        if self.__flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне цикла событий (скрипты, тесты) - сразу
+            self.flush()
+            return
+        self.__flush_handle = loop.call_later(FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        self.__flush_handle = None
+        for room in self.__unflushed:
+            log = self.__logs.get(room)
+            if log is not None:
+                log.flush()
+        self.__unflushed.clear()
+
+    def recent(self, room: str):
+        '''
+        Messages kept for the room, oldest first.
+        '''
+        ring = self.ring(room, create=False)
+        if ring is None:
+            return []
+        if self.__max_age is not None:
+            oldest = time.time() - self.__max_age
+            while ring and ring[0][0] < oldest:
+                ring.popleft()
+        return [message for _, message in ring]
+
+    def release(self, room: str):
+        '''
+        Closes the log and drops the ring of a room nobody is in.
+        '''
+        self.__rings.pop(room, None)
+        log = self.__logs.pop(room, None)
+        if log is not None:
+            self.__unflushed.discard(room)
+            log.close()
+
+    def close(self):
+        if self.__flush_handle is not None:
+            self.__flush_handle.cancel()
+            self.__flush_handle = None
+        for log in self.__logs.values():
+            log.close()
+        self.__logs.clear()
+        self.__unflushed.clear()
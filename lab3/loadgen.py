@@ -0,0 +1,264 @@
+'''
+Headless load generator for the chat servers. Opens many simulated
+clients, spreads them over rooms, sends room messages at a fixed total
+rate and reports throughput, end-to-end delivery latency percentiles and
+the server's resident memory.
+
+Examples:
+    # сервер запускается самим генератором, отчет в JSON для сравнения прогонов
+    python loadgen.py --spawn server --clients 2000 --rooms 200 --rate 2000 -o server.json
+    python loadgen.py --spawn server2 --clients 2000 --rooms 200 --rate 2000 -o server2.json
+
+    # уже запущенный сервер; RSS берется по его pid
+    python loadgen.py --port 8888 --server-pid 12345
+'''
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from protocol import open_stream
+
+# Метка сообщений генератора: время отправки в нс и номер сообщения
+TAG = 'lg'
+SERVERS = ('server', 'server2')
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def process_rss(pid: int):
+    '''
+    Resident memory in bytes of a process and its children (worker mode).
+    '''
+    total = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+            with open(f'/proc/{pid}/task/{pid}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+def raise_fd_limit():
+    # Тысячи соединений не помещаются в стандартные 1024 дескриптора
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def spawn_server(kind: str, host: str, port: int, workdir: str):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{kind}.py')
+    process = subprocess.Popen([sys.executable, script, host, str(port)], cwd=workdir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            with socket.create_connection((host, port), timeout=0.1):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"{kind} did not start on {host}:{port}")
+
+
+class SimulatedClient:
+    def __init__(self, index: int, room: str, kind: str):
+        self.index = index
+        self.room = room
+        self.kind = kind
+        self.name = f"{TAG}{index}"
+        self.stream = None
+        self.ready = asyncio.Event()
+        self.latencies_ns = []
+        self.__joined = 0
+
+    async def connect(self, host: str, port: int):
+        self.stream = await open_stream(host, port)
+        # server2 сначала спрашивает имя, server.py присылает приветствие
+        await self.stream.read()
+        if self.kind == 'server2':
+            self.stream.write(self.name.encode('utf8'))
+        self.stream.write(f"/join {self.room}".encode('utf8'))
+        await self.stream.drain()
+
+    def is_join_confirmation(self, text: str):
+        if self.kind == 'server':
+            return text.startswith('Room changed')
+        # server2 объявляет вход в default, а затем в выбранную комнату
+        if f"{self.name} has joined the room" in text:
+            self.__joined += 1
+        return self.__joined == 2
+
+    async def receive(self):
+        while (data := await self.stream.read()) is not None:
+            received_ns = time.perf_counter_ns()
+            text = data.decode('utf8', errors='replace')
+            if not self.ready.is_set():
+                if self.is_join_confirmation(text):
+                    self.ready.set()
+                continue
+            position = text.find(f" {TAG} ")
+            if position != -1:
+                sent_ns = int(text[position + len(TAG) + 2:].split()[0])
+                self.latencies_ns.append(received_ns - sent_ns)
+
+    def send(self, sequence: int):
+        self.stream.write(f" {TAG} {time.perf_counter_ns()} {sequence}".encode('utf8'))
+
+
+async def send_at_rate(clients, rate: float, duration: float):
+    # Расписание по абсолютному времени: отставание догоняется пачкой
+    interval = 1 / rate
+    total = int(rate * duration)
+    start = time.perf_counter()
+    for sequence in range(total):
+        delay = start + sequence * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        client = clients[sequence % len(clients)]
+        client.send(sequence)
+        await client.stream.drain()
+    return total, time.perf_counter() - start
+
+
+async def connect_all(clients, host: str, port: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect(client):
+        async with semaphore:
+            await client.connect(host, port)
+
+    await asyncio.gather(*(connect(client) for client in clients))
+
+
+async def sample_rss(pid: int, samples: list, period: float = 0.25):
+    while True:
+        samples.append(process_rss(pid))
+        await asyncio.sleep(period)
+
+
+async def run_load(kind: str, host: str, port: int, n_clients: int, n_rooms: int, rate: float,
+                   duration: float, server_pid: int = None, concurrency: int = 200,
+                   drain_timeout: float = 5.0):
+    clients = [SimulatedClient(i, f"room{i % n_rooms}", kind) for i in range(n_clients)]
+    rss_samples = []
+    sampler = asyncio.ensure_future(sample_rss(server_pid, rss_samples)) if server_pid else None
+
+    start = time.perf_counter()
+    await connect_all(clients, host, port, concurrency)
+    receivers = [asyncio.ensure_future(client.receive()) for client in clients]
+    await asyncio.wait_for(asyncio.gather(*(client.ready.wait() for client in clients)), 60)
+    connect_time = time.perf_counter() - start
+    rss_idle = process_rss(server_pid) if server_pid else None
+
+    sent, send_time = await send_at_rate(clients, rate, duration)
+
+    # Ждем доставки хвоста, но не дольше drain_timeout
+    room_sizes = [len(range(room, n_clients, n_rooms)) for room in range(n_rooms)]
+    expected = sum(room_sizes[i % n_clients % n_rooms] for i in range(sent))
+    deadline = time.perf_counter() + drain_timeout
+    while sum(len(client.latencies_ns) for client in clients) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start - connect_time
+
+    for receiver in receivers:
+        receiver.cancel()
+    for client in clients:
+        client.stream.writer.close()
+    if sampler is not None:
+        sampler.cancel()
+
+    latencies = sorted(latency for client in clients for latency in client.latencies_ns)
+    delivered = len(latencies)
+    return {
+        'server': kind,
+        'clients': n_clients,
+        'rooms': n_rooms,
+        'target_rate': rate,
+        'duration_s': duration,
+        'connect_s': connect_time,
+        'sent': sent,
+        'send_rate': sent / send_time,
+        'expected_deliveries': expected,
+        'delivered': delivered,
+        'deliveries_per_s': delivered / elapsed,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50) / 1e6 if latencies else None,
+            'p99': percentile(latencies, 0.99) / 1e6 if latencies else None,
+            'p999': percentile(latencies, 0.999) / 1e6 if latencies else None,
+            'max': latencies[-1] / 1e6 if latencies else None,
+        },
+        'server_rss_mb': {
+            'idle': rss_idle / 2**20 if rss_idle else None,
+            'peak': max(rss_samples) / 2**20 if rss_samples else None,
+        },
+    }
+
+
+def print_report(report):
+    latency = report['latency_ms']
+    rss = report['server_rss_mb']
+    print(f"{report['server']}: {report['clients']} clients in {report['rooms']} rooms, "
+          f"connected in {report['connect_s']:.2f}s", file=sys.stderr)
+    print(f"  sent {report['sent']} at {report['send_rate']:.0f}/s, delivered {report['delivered']}"
+          f"/{report['expected_deliveries']} ({report['deliveries_per_s']:.0f}/s)", file=sys.stderr)
+    if latency['p50'] is not None:
+        print(f"  latency p50 {latency['p50']:.2f} ms, p99 {latency['p99']:.2f} ms, "
+              f"p999 {latency['p999']:.2f} ms, max {latency['max']:.2f} ms", file=sys.stderr)
+    if rss['peak'] is not None:
+        print(f"  server RSS idle {rss['idle']:.1f} MB, peak {rss['peak']:.1f} MB", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load generator for the chat servers")
+    parser.add_argument('--server', choices=SERVERS, default='server', help="dialect of the server under test")
+    parser.add_argument('--spawn', choices=SERVERS, default=None, help="start this server on a free port")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--server-pid', type=int, default=None, help="pid to sample RSS of")
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--rooms', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=1000, help="messages per second, all clients")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of sending")
+    parser.add_argument('-o', '--output', default=None, help="JSON report path")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    kind = args.spawn or args.server
+    server = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.spawn:
+            with socket.socket() as sock:
+                sock.bind((args.host, 0))
+                args.port = sock.getsockname()[1]
+            server = spawn_server(args.spawn, args.host, args.port, workdir)
+            args.server_pid = server.pid
+        try:
+            report = asyncio.run(run_load(kind, args.host, args.port, args.clients, args.rooms, args.rate,
+                                          args.duration, args.server_pid))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
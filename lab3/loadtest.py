@@ -0,0 +1,112 @@
+'''
+In-process load test of the Server bookkeeping with simulated connections.
+No sockets are opened: every connection is a StreamReader fed by the test
+and a writer that only counts bytes, so the numbers show the server's own
+cost per command and per delivered message.
+
+Usage: python loadtest.py [CLIENTS ...]
+'''
+import asyncio
+import logging
+import sys
+import time
+from server import Server
+from protocol import MAGIC, encode_frame
+
+
+class SimulatedWriter:
+    def __init__(self, peername):
+        self.peername = peername
+        self.messages = 0
+        self.bytes_written = 0
+
+    def get_extra_info(self, name):
+        return self.peername if name == 'peername' else None
+
+    def write(self, data: bytes):
+        self.messages += 1
+        self.bytes_written += len(data)
+
+    def writelines(self, data):
+        self.write(b''.join(data))
+
+    async def drain(self):
+        pass
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+
+async def settle():
+    # Даем задачам сервера разобрать все поданные данные
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def feed_each(readers, messages):
+    start = time.perf_counter()
+    for reader, message in zip(readers, messages):
+        reader.feed_data(encode_frame(message.encode('utf8')))
+        await asyncio.sleep(0)
+    await settle()
+    return time.perf_counter() - start
+
+
+async def run_load(n_clients, room_size, n_messages):
+    server = Server('127.0.0.1', 0)
+    server.logger.setLevel(logging.WARNING)
+
+    readers = []
+    writers = []
+    start = time.perf_counter()
+    for i in range(n_clients):
+        readers.append(asyncio.StreamReader())
+        readers[-1].feed_data(MAGIC)
+        writers.append(SimulatedWriter(('10.0.0.1', i)))
+        server.accept_client(readers[-1], writers[-1])
+    await settle()
+    connect_time = time.perf_counter() - start
+
+    join_time = await feed_each(readers, [f"/join room{i // room_size}" for i in range(n_clients)])
+
+    queues = server.queue_stats()
+    senders = [readers[i % n_clients] for i in range(n_messages)]
+    message_time = await feed_each(senders, ["hello"] * n_messages)
+    delivered = server.queue_stats()['sent'] - queues['sent']
+    writes = server.queue_stats()['writes'] - queues['writes']
+    queues = server.queue_stats()
+
+    disconnect_time = await feed_each(readers, ["quit"] * n_clients)
+
+    return {
+        'clients': n_clients,
+        'rooms': len(server.rooms),
+        'connect_us': connect_time / n_clients * 1e6,
+        'join_us': join_time / n_clients * 1e6,
+        'message_us': message_time / n_messages * 1e6,
+        'deliveries_per_message': delivered / n_messages,
+        'writes_per_message': writes / n_messages,
+        'disconnect_us': disconnect_time / n_clients * 1e6,
+        'max_queue_depth': queues['max_depth'],
+        'dropped': queues['dropped'],
+    }
+
+
+async def main(client_counts, room_size=10, n_messages=20000):
+    print(f"{'clients':>8}{'rooms':>8}{'connect us':>12}{'join us':>10}"
+          f"{'message us':>12}{'fan-out':>9}{'writes':>8}{'disconnect us':>15}{'max queue':>11}{'dropped':>9}")
+    for n_clients in client_counts:
+        result = await run_load(n_clients, room_size, n_messages)
+        print(f"{result['clients']:>8}{result['rooms']:>8}{result['connect_us']:>12.1f}"
+              f"{result['join_us']:>10.1f}{result['message_us']:>12.1f}"
+              f"{result['deliveries_per_message']:>9.1f}{result['writes_per_message']:>8.1f}"
+              f"{result['disconnect_us']:>15.1f}"
+              f"{result['max_queue_depth']:>11}{result['dropped']:>9}")
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000]
+    asyncio.run(main(counts))
@@ -0,0 +1,125 @@
+import asyncio
+import bisect
+import time
+
+# Границы корзин гистограммы задержки цикла событий, в секундах
+LAG_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+LAG_INTERVAL = 0.1
+
+
+class Histogram:
+    '''
+    Cumulative histogram in the Prometheus sense: counts per upper bound,
+    plus sum and count of all observations.
+    '''
+    def __init__(self, buckets=LAG_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    '''
+    Counters of one server process and a monitor of event-loop lag: a task
+    that sleeps for a fixed interval and records how late it wakes up.
+    '''
+    def __init__(self, lag_interval: float = LAG_INTERVAL):
+        self.lag_interval = lag_interval
+        self.loop_lag = Histogram()
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.started = time.monotonic()
+        # Скорость считается по двум последним секундным отсчетам
+        self.__rate_sample = (self.started, 0)
+        self.messages_per_s = 0.0
+
+    def message_received(self, size: int):
+        self.messages_in += 1
+        self.bytes_in += size
+
+    async def monitor_loop_lag(self):
+        expected = time.monotonic() + self.lag_interval
+        while True:
+            await asyncio.sleep(self.lag_interval)
+            now = time.monotonic()
+            self.loop_lag.observe(max(0.0, now - expected))
+            expected = now + self.lag_interval
+
+            sample_time, sample_messages = self.__rate_sample
+            if now - sample_time >= 1.0:
+                self.messages_per_s = (self.messages_in - sample_messages) / (now - sample_time)
+                self.__rate_sample = (now, self.messages_in)
+
+
+def render_prometheus(stats: dict, lag: Histogram):
+    '''
+    Prometheus text exposition of server stats (see Server.stats) and the
+    loop lag histogram.
+    '''
+    lines = []
+
+    def metric(name, kind, value, help_text):
+        lines.append(f"# HELP chat_{name} {help_text}")
+        lines.append(f"# TYPE chat_{name} {kind}")
+        lines.append(f"chat_{name} {value}")
+
+    metric('connections', 'gauge', stats['clients'], "Connected clients.")
+    metric('rooms', 'gauge', stats['rooms'], "Rooms with at least one client of this process.")
+    metric('messages_received_total', 'counter', stats['messages_in'], "Messages received from clients.")
+    metric('messages_per_second', 'gauge', f"{stats['messages_per_s']:.3f}", "Messages received in the last second.")
+    metric('bytes_received_total', 'counter', stats['bytes_in'], "Payload bytes received from clients.")
+    metric('messages_sent_total', 'counter', stats['sent'], "Messages written to clients.")
+    metric('bytes_sent_total', 'counter', stats['bytes_out'], "Payload bytes written to clients.")
+    metric('writes_total', 'counter', stats['writes'], "Socket writes, several messages each when coalesced.")
+    metric('send_queue_depth', 'gauge', stats['queued'], "Messages waiting in all send queues.")
+    metric('send_queue_max_depth', 'gauge', stats['max_depth'], "Deepest send queue seen.")
+    metric('messages_dropped_total', 'counter', stats['dropped'], "Messages dropped on send queue overflow.")
+    metric('slow_disconnects_total', 'counter', stats['slow_disconnects'], "Clients disconnected for being slow.")
+
+    lines.append("# HELP chat_loop_lag_seconds Event loop wake-up delay.")
+    lines.append("# TYPE chat_loop_lag_seconds histogram")
+    for bound, count in lag.cumulative():
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f'chat_loop_lag_seconds_bucket{{le="{le}"}} {count}')
+    lines.append(f"chat_loop_lag_seconds_sum {lag.sum}")
+    lines.append(f"chat_loop_lag_seconds_count {lag.count}")
+    return '\n'.join(lines) + '\n'
+
+
+async def serve_http(host: str, port: int, render):
+    '''
+    Minimal HTTP server answering GET /metrics with the text from render().
+    '''
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await reader.readline()).strip():
+                pass
+            if request.split()[:2] in ([b'GET', b'/metrics'], [b'GET', b'/']):
+                status, body = '200 OK', render().encode('utf8')
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode('latin1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from protocol import MessageStream, ProtocolError
+
+# Что делать, если клиент не успевает читать и его очередь заполнена
+DROP_OLDEST = 'drop-oldest'
+DISCONNECT = 'disconnect'
+OVERFLOW_POLICIES = (DROP_OLDEST, DISCONNECT)
+
+MAX_QUEUED_MESSAGES = 1024
+
+
+class Outbox:
+    '''
+    Bounded queue of outgoing messages of one connection, written out by its
+    own task. Senders never wait for a slow peer: when the queue is full the
+    oldest message is dropped or the connection is closed, depending on the
+    policy. Messages put before start() wait until the stream is negotiated.
+    With `coalesce` everything queued since the last write goes out in one
+    writelines call. A message that cannot be written is dropped and logged
+    to `logger`; the connection stays open.
+    '''
+    def __init__(self, writer: asyncio.StreamWriter, max_messages: int = MAX_QUEUED_MESSAGES,
+                 policy: str = DROP_OLDEST, coalesce: bool = True, logger: logging.Logger = None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy}")
+        self.__writer = writer
+        self.__policy = policy
+        self.__coalesce = coalesce
+        self.__logger = logger or logging.getLogger(__name__)
+        self.__queue: asyncio.Queue = asyncio.Queue(max_messages)
+        self.__task: asyncio.Task = None
+        self.__closed = False
+        self.overflowed = False
+        self.dropped = 0
+        self.sent = 0
+        self.bytes_sent = 0
+        self.writes = 0
+        self.max_depth = 0
+
+    @property
+    def policy(self):
+        return self.__policy
+
+    @property
+    def depth(self):
+        return self.__queue.qsize()
+
+    @property
+    def closed(self):
+        return self.__closed
+
+    def start(self, stream: MessageStream):
+        self.__task = asyncio.ensure_future(self.__run(stream))
+        self.__task.add_done_callback(self.__finished)
+
+    def __finished(self, task: asyncio.Task):
+        # Исключение забирается здесь, иначе asyncio пишет "Task exception was never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            self.__logger.error(f"Writer of {self.__writer.get_extra_info('peername')} failed: "
+                                f"{task.exception()!r}")
+
+    def put(self, message):
+        '''
+        Queues a message, or a list of messages to be written at once, without
+        blocking. Returns False if it was not queued.
+        '''
+        if self.__closed:
+            self.dropped += 1
+            return False
+
+        if self.__queue.full():
+            self.overflowed = True
+            if self.__policy == DISCONNECT:
+                self.dropped += self.__queue.qsize() + 1
+                self.abort()
+                return False
+            self.__queue.get_nowait()
+            self.dropped += 1
+
+        self.__queue.put_nowait(message)
+        self.max_depth = max(self.max_depth, self.__queue.qsize())
+        return True
+
+    def close(self):
+        '''
+        Closes the connection once the already queued messages are written.
+        '''
+        if self.__closed:
+            return
+        self.__closed = True
+        if self.__task is None:
+            self.__writer.close()
+            return
+        if self.__queue.full():
+            self.__queue.get_nowait()
+            self.dropped += 1
+        self.__queue.put_nowait(None)
+
+    async def wait_closed(self):
+        # Ждет, пока очередь будет дописана и соединение закрыто
+        if self.__task is not None:
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+
+    def abort(self):
+        # Закрываем сразу, не дописывая очередь
+        self.__closed = True
+        if self.__task is not None:
+            self.__task.cancel()
+        self.__writer.close()
+
+    def __take(self, item):
+        # Собирает сообщения, накопившиеся за текущий проход цикла событий
+        batch = []
+        while item is not None:
+            if isinstance(item, list):
+                batch.extend(item)
+            else:
+                batch.append(item)
+            if not self.__coalesce or self.__queue.empty():
+                return batch, False
+            item = self.__queue.get_nowait()
+        return batch, True
+
+    def __write(self, stream: MessageStream, batch: list):
+        # Возвращает записанные сообщения; не влезающие в кадр отбрасываются
+        try:
+            if len(batch) == 1:
+                stream.write(batch[0])
+            elif batch:
+                stream.write_many(batch)
+            return batch
+        except ProtocolError as e:
+            if len(batch) > 1:
+                # write_many ничего не пишет, если не влезает хотя бы одно сообщение
+                return [written for message in batch for written in self.__write(stream, [message])]
+            self.dropped += 1
+            self.__logger.warning(f"Message to {self.__writer.get_extra_info('peername')} dropped: {e}")
+            return []
+
+    async def __run(self, stream: MessageStream):
+        try:
+            while True:
+                batch, closing = self.__take(await self.__queue.get())
+                if self.__writer.is_closing():
+                    # Соединение уже закрыто; uvloop в отличие от asyncio бросает RuntimeError на write
+                    # В очереди может остаться только метка закрытия от close()
+                    sentinel = self.__closed and not closing
+                    self.__closed = True
+                    self.dropped += len(batch) + self.__queue.qsize() - sentinel
+                    break
+                written = self.__write(stream, batch)
+                self.sent += len(written)
+                self.bytes_sent += sum(map(len, written))
+                self.writes += bool(written)
+                if closing:
+                    break
+                await stream.drain()
+        except ConnectionError:
+            self.__closed = True
+        finally:
+            self.__writer.close()
@@ -0,0 +1,152 @@
+import asyncio
+import struct
+
+# Новый клиент первым делом шлет MAGIC и ждет такой же ответ, после чего обе
+# стороны обмениваются кадрами: 4 байта длины (big-endian) + UTF-8 текст.
+# Старые клиенты MAGIC не шлют и продолжают работать с сырым текстом.
+MAGIC = b'\x00CHAT-FRAMED/1\n'
+HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 1 << 20
+# Сервер добавляет к сообщению клиента ник и служебный префикс, поэтому
+# входящее сообщение и ник должны оставлять для них место в кадре
+MAX_NICKNAME_SIZE = 128
+MAX_MESSAGE_SIZE = MAX_FRAME_SIZE - 2 * MAX_NICKNAME_SIZE
+LEGACY_READ_SIZE = 4096
+HANDSHAKE_TIMEOUT = 0.5
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(payload: bytes, max_size: int = MAX_FRAME_SIZE) -> bytes:
+    if len(payload) > max_size:
+        raise ProtocolError(f"Frame of {len(payload)} bytes is too large")
+    return HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader, max_size: int = MAX_FRAME_SIZE):
+    try:
+        header = await reader.readexactly(HEADER.size)
+        (size,) = HEADER.unpack(header)
+        if size > max_size:
+            raise ProtocolError(f"Frame of {size} bytes is too large")
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class MessageStream:
+    '''
+    Reads and writes whole messages on a connection, either as length-prefixed
+    frames or in the legacy mode of old clients: one read() per message, or
+    one line per message when `lines` is set.
+    '''
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 framed: bool, pending: bytes = b'', lines: bool = False):
+        self.__reader = reader
+        self.__writer = writer
+        self.__framed = framed
+        self.__pending = pending
+        self.__lines = lines
+
+    @property
+    def reader(self):
+        return self.__reader
+
+    @property
+    def writer(self):
+        return self.__writer
+
+    @property
+    def framed(self):
+        return self.__framed
+
+    async def read(self):
+        '''
+        Returns the next message as bytes, or None when the peer has gone.
+        '''
+        if self.__framed:
+            return await read_frame(self.__reader)
+
+        if self.__lines:
+            # Байты, прочитанные при согласовании, могут содержать часть строки
+            line, newline, rest = self.__pending.partition(b'\n')
+            if newline:
+                self.__pending = rest
+                return line + newline
+            self.__pending = b''
+            data = line + await self.__reader.readline()
+        elif self.__pending:
+            data, self.__pending = self.__pending, b''
+        else:
+            data = await self.__reader.read(LEGACY_READ_SIZE)
+        return data or None
+
+    def encode(self, payload: bytes) -> bytes:
+        return encode_frame(payload) if self.__framed else payload
+
+    def write(self, payload: bytes):
+        self.__writer.write(self.encode(payload))
+
+    def write_many(self, payloads: list[bytes]):
+        # Одним вызовом writelines без копирования сообщений по отдельности;
+        # старым клиентам сообщения разделяются переводом строки
+        if self.__framed:
+            parts = []
+            for payload in payloads:
+                if len(payload) > MAX_FRAME_SIZE:
+                    raise ProtocolError(f"Frame of {len(payload)} bytes is too large")
+                parts.append(HEADER.pack(len(payload)))
+                parts.append(payload)
+            self.__writer.writelines(parts)
+        else:
+            # Перевод строки добавляется только к сообщениям, которые им не заканчиваются
+            self.__writer.write(b''.join(payload if payload.endswith(b'\n') else payload + b'\n'
+                                         for payload in payloads[:-1]) + payloads[-1])
+
+    async def drain(self):
+        await self.__writer.drain()
+
+
+async def accept_stream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                        lines: bool = False, timeout: float = HANDSHAKE_TIMEOUT):
+    '''
+    Server side of the handshake. Clients that do not send MAGIC within
+    `timeout` or send anything else are served in legacy mode; bytes read
+    while deciding are kept as the start of their first message.
+    '''
+    try:
+        data = await asyncio.wait_for(reader.read(LEGACY_READ_SIZE), timeout)
+    except asyncio.TimeoutError:
+        return MessageStream(reader, writer, False, lines=lines)
+
+    # MAGIC мог прийти в нескольких TCP-сегментах
+    while data and len(data) < len(MAGIC) and MAGIC.startswith(data):
+        more = await reader.read(len(MAGIC) - len(data))
+        if not more:
+            break
+        data += more
+
+    if data == MAGIC:
+        writer.write(MAGIC)
+        return MessageStream(reader, writer, True)
+    return MessageStream(reader, writer, False, pending=data, lines=lines)
+
+
+async def open_stream(host: str, port: int):
+    '''
+    Client side: connects, negotiates framing and returns a MessageStream.
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(MAGIC)
+    await writer.drain()
+
+    try:
+        answer = await reader.readexactly(len(MAGIC))
+    except asyncio.IncompleteReadError:
+        answer = b''
+    if answer != MAGIC:
+        writer.close()
+        raise ProtocolError("Server does not support framed protocol")
+    return MessageStream(reader, writer, True)
@@ -0,0 +1,31 @@
+import asyncio
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# auto - uvloop, если он установлен, иначе стандартный цикл asyncio
+LOOPS = ('auto', 'asyncio', 'uvloop')
+
+
+def set_loop_policy(name: str = 'auto'):
+    '''
+    Installs the event loop policy for the next asyncio.run() and returns
+    the name of the loop that will be used.
+    '''
+    if name not in LOOPS:
+        raise ValueError(f"Unknown event loop {name}")
+    if name == 'uvloop' and uvloop is None:
+        raise RuntimeError("uvloop is not installed")
+
+    if name != 'asyncio' and uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return 'uvloop'
+    asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+    return 'asyncio'
+
+
+def run(main, loop: str = 'auto'):
+    set_loop_policy(loop)
+    return asyncio.run(main)
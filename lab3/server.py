@@ -1,22 +1,64 @@
 import asyncio
-import sys
+import argparse
 import logging
+import logging.handlers
+import multiprocessing
 import pathlib
 import os
+import queue
+import signal
+import tempfile
+import time
+from bus import Bus, WORKER_GONE, WORKER_HELLO, bind_hub_socket, run_hub
 from client_model import Client
+from history import RoomHistory, HISTORY_SIZE
+from metrics import Metrics, render_prometheus, serve_http
+from protocol import MAX_MESSAGE_SIZE, MAX_NICKNAME_SIZE
+from outbox import MAX_QUEUED_MESSAGES, DROP_OLDEST, DISCONNECT, OVERFLOW_POLICIES
+from runtime import LOOPS, run
 from datetime import datetime
 
+SHUTDOWN_TIMEOUT = 5.0
+
 
 class Server:
-    def __init__(self, ip: str, port: int, loop: asyncio.AbstractEventLoop):
+    def __init__(self, ip: str, port: int,
+                 max_queued: int = MAX_QUEUED_MESSAGES, overflow_policy: str = DROP_OLDEST,
+                 bus_path: str = None, history: RoomHistory = None, coalesce: bool = True,
+                 metrics_port: int = None, idle_timeout: float = None):
         self.__ip: str = ip
         self.__port: int = port
-        self.__loop: asyncio.AbstractEventLoop = loop
+        # Цикл событий появляется только в serve()
+        self.__loop: asyncio.AbstractEventLoop = None
+        self.__stopping: asyncio.Event = asyncio.Event()
+        self.__closing: bool = False
+        self.__idle_timeout: float = idle_timeout
+        self.__max_queued: int = max_queued
+        self.__overflow_policy: str = overflow_policy
+        self.__coalesce: bool = coalesce
+        self.__metrics_port: int = metrics_port
+        self.__metrics: Metrics = Metrics()
+        # Счетчики уже отключенных клиентов; у подключенных они хранятся в Outbox
+        self.__dropped_messages: int = 0
+        self.__sent_messages: int = 0
+        self.__sent_bytes: int = 0
+        self.__writes: int = 0
+        self.__slow_disconnects: int = 0
+        self.__log_listener: logging.handlers.QueueListener = None
         self.__logger: logging.Logger = self.initialize_logger()
         self.__clients: dict[asyncio.Task, Client] = {}
-        self.__rooms = {
-                'default': []
+        # Индексы для поиска за O(1): ник -> клиент, клиент -> комната, комната -> клиенты
+        self.__nicknames: dict[str, Client] = {}
+        self.__client_rooms: dict[Client, str] = {}
+        self.__rooms: dict[str, set[Client]] = {
+                'default': set()
                 }
+        # В режиме нескольких воркеров: клиенты остальных процессов,
+        # ник -> (pid воркера, комната) и комната -> ники
+        self.__bus: Bus = Bus(bus_path, self.handle_bus_event, self.stop) if bus_path else None
+        self.__remote_nicknames: dict[str, tuple[int, str]] = {}
+        self.__remote_rooms: dict[str, set[str]] = {}
+        self.__history: RoomHistory = history if history is not None else RoomHistory()
 
         self.logger.info(f"Server Initialized with {self.ip}:{self.port}")
 
@@ -40,12 +82,149 @@ class Server:
     def clients(self):
         return self.__clients
 
+    @property
+    def rooms(self):
+        return self.__rooms
+
+    def queue_stats(self):
+        '''
+        Outbound queue metrics: current and peak depth, messages and writes
+        of connected clients, dropped messages and connections closed for
+        being too slow.
+        '''
+        outboxes = [client.outbox for client in self.clients.values()]
+        return {
+            'clients': len(outboxes),
+            'queued': sum(outbox.depth for outbox in outboxes),
+            'max_depth': max((outbox.max_depth for outbox in outboxes), default=0),
+            'sent': self.__sent_messages + sum(outbox.sent for outbox in outboxes),
+            'bytes_out': self.__sent_bytes + sum(outbox.bytes_sent for outbox in outboxes),
+            'writes': self.__writes + sum(outbox.writes for outbox in outboxes),
+            'dropped': self.__dropped_messages + sum(outbox.dropped for outbox in outboxes),
+            'slow_disconnects': self.__slow_disconnects,
+        }
+
+    @property
+    def metrics(self):
+        return self.__metrics
+
+    def stats(self):
+        '''
+        Everything exported by /stats and the metrics endpoint.
+        '''
+        lag = self.__metrics.loop_lag
+        return {
+            **self.queue_stats(),
+            'rooms': sum(1 for clients in self.__rooms.values() if clients),
+            'messages_in': self.__metrics.messages_in,
+            'bytes_in': self.__metrics.bytes_in,
+            'messages_per_s': self.__metrics.messages_per_s,
+            'loop_lag_mean_ms': lag.sum / lag.count * 1e3 if lag.count else 0.0,
+            'loop_lag_max_ms': lag.max * 1e3,
+        }
+
+    def render_metrics(self):
+        return render_prometheus(self.stats(), self.__metrics.loop_lag)
+
+    def get_client(self, nickname: str):
+        return self.__nicknames.get(nickname)
+
+    def get_room(self, client: Client):
+        return self.__client_rooms.get(client)
+
+    def join_room(self, client: Client, room: str):
+        old_room = self.leave_room(client)
+        if old_room is not None:
+            self.release_if_empty(old_room)
+        self.__rooms.setdefault(room, set()).add(client)
+        self.__client_rooms[client] = room
+        self.publish('join', nick=client.nickname, room=room)
+
+    def leave_room(self, client: Client):
+        room = self.__client_rooms.pop(client, None)
+        if room is not None:
+            self.__rooms[room].discard(client)
+            self.publish('leave', nick=client.nickname, room=room)
+        return room
+
+    def release_if_empty(self, room: str):
+        # Лог и буфер истории нужны, только пока в комнате кто-то есть, здесь или на другом воркере
+        if not self.__rooms.get(room) and not self.__remote_rooms.get(room):
+            self.__history.release(room)
+
+    def nickname_taken(self, nickname: str, client: Client):
+        owner = self.__nicknames.get(nickname)
+        return (owner is not None and owner is not client) or nickname in self.__remote_nicknames
+
+    @property
+    def history(self):
+        return self.__history
+
+    def send_to_room(self, room: str, message: str):
+        data = message.encode('utf8')
+        self.__history.append(room, data)
+        self.broadcast_message(data, self.__rooms.get(room, ()))
+        self.publish('room', room=room, message=message)
+
+    def room_members(self):
+        # Ники во всех комнатах, включая клиентов других воркеров
+        members = {room: [client.nickname for client in clients] for room, clients in self.__rooms.items()}
+        for room, nicknames in self.__remote_rooms.items():
+            members.setdefault(room, []).extend(nicknames)
+        return members
+
+    def publish(self, op: str, **event):
+        if self.__bus is not None:
+            self.__bus.publish(op, **event)
+
+    def handle_bus_event(self, event: dict):
+        op = event['op']
+        if op == 'room':
+            data = event['message'].encode('utf8')
+            self.__history.append(event['room'], data)
+            self.broadcast_message(data, self.__rooms.get(event['room'], ()))
+        elif op == 'personal':
+            target = self.get_client(event['nick'])
+            if target is not None:
+                target.send(event['message'].encode('utf8'))
+        elif op == 'join':
+            _, old_room = self.forget_remote(event['nick'])
+            if old_room is not None:
+                self.release_if_empty(old_room)
+            self.__remote_nicknames[event['nick']] = (event['worker'], event['room'])
+            self.__remote_rooms.setdefault(event['room'], set()).add(event['nick'])
+        elif op == 'leave':
+            _, room = self.forget_remote(event['nick'])
+            if room is not None:
+                self.release_if_empty(room)
+        elif op == 'nick':
+            worker, room = self.forget_remote(event['old'])
+            if room is not None:
+                self.__remote_nicknames[event['new']] = (worker, room)
+                self.__remote_rooms[room].add(event['new'])
+        elif op == WORKER_HELLO:
+            # Новый воркер не видел событий, отправленных до его подключения к шине
+            for client, room in self.__client_rooms.items():
+                self.publish('join', nick=client.nickname, room=room)
+        elif op == WORKER_GONE:
+            for nickname, (worker, _) in list(self.__remote_nicknames.items()):
+                if worker == event['worker']:
+                    _, room = self.forget_remote(nickname)
+                    self.release_if_empty(room)
+
+    def forget_remote(self, nickname: str):
+        worker, room = self.__remote_nicknames.pop(nickname, (None, None))
+        if room is not None:
+            self.__remote_rooms[room].discard(nickname)
+        return worker, room
+
     def initialize_logger(self):
         path = pathlib.Path(os.path.join(os.getcwd(), "logs"))
         path.mkdir(parents=True, exist_ok=True)
 
         logger = logging.getLogger('Server')
         logger.setLevel(logging.DEBUG)
+        logger.handlers.clear()
 
         ch = logging.StreamHandler()
         fh = logging.FileHandler(
@@ -60,166 +239,336 @@ class Server:
 
         ch.setFormatter(formatter)
         fh.setFormatter(formatter)
-        logger.addHandler(ch)
-        logger.addHandler(fh)
+
+        # Запись в консоль и файл идет в отдельном потоке, цикл событий только кладет записи в очередь
+        records = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        self.__log_listener = logging.handlers.QueueListener(records, ch, fh, respect_handler_level=True)
+        self.__log_listener.start()
 
         return logger
 
-    def start_server(self):
+    def start_server(self, loop: str = 'auto', shutdown_timeout: float = SHUTDOWN_TIMEOUT):
+        '''
+        Runs the server until SIGINT/SIGTERM on the chosen event loop
+        (see runtime.LOOPS).
+        '''
         try:
-            self.server = asyncio.start_server(
-                self.accept_client, self.ip, self.port
-            )
-            self.loop.run_until_complete(self.server)
-            self.loop.run_forever()
+            run(self.serve(shutdown_timeout), loop)
         except Exception as e:
             self.logger.error(e)
         except KeyboardInterrupt:
-            self.logger.warning("Keyboard Interrupt Detected. Shutting down!")
+            # Сюда попадаем, только если обработчики сигналов не удалось установить
+            self.logger.warning("Keyboard Interrupt Detected. Shut down without draining!")
+        finally:
+            self.__log_listener.stop()
+
+    def stop(self):
+        self.__stopping.set()
+
+    async def serve(self, shutdown_timeout: float = SHUTDOWN_TIMEOUT):
+        self.__loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.__loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Windows или не главный поток
+                pass
+
+        background = [asyncio.create_task(self.__metrics.monitor_loop_lag())]
+        if self.__idle_timeout is not None:
+            background.append(asyncio.create_task(self.close_idle_clients()))
+        if self.__bus is not None:
+            await self.__bus.connect()
+        metrics_server = None
+        if self.__metrics_port is not None:
+            metrics_server = await serve_http(self.ip, self.__metrics_port, self.render_metrics)
+            self.logger.info(f"Metrics at http://{self.ip}:{self.__metrics_port}/metrics")
+
+        # Воркеры слушают один и тот же порт, соединения между ними распределяет ядро
+        self.server = await asyncio.start_server(
+            self.accept_client, self.ip, self.port, reuse_port=self.__bus is not None
+        )
+        self.logger.info(f"Serving on {self.ip}:{self.port} with {type(self.__loop).__module__} loop")
 
-        self.shutdown_server()
+        try:
+            await self.__stopping.wait()
+        finally:
+            self.server.close()
+            if metrics_server is not None:
+                metrics_server.close()
+            await self.shutdown_server(shutdown_timeout)
+            for task in background:
+                task.cancel()
+
+    async def close_idle_clients(self):
+        # Соединения, от которых давно ничего не приходило, считаются мертвыми
+        while True:
+            await asyncio.sleep(self.__idle_timeout / 2)
+            oldest = time.monotonic() - self.__idle_timeout
+            for client in list(self.clients.values()):
+                if client.last_active < oldest:
+                    self.logger.info(f"Idle timeout: {client}")
+                    client.outbox.abort()
 
     def accept_client(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
-        client = Client(client_reader, client_writer)
+        client = Client(client_reader, client_writer, self.__max_queued, self.__overflow_policy,
+                        self.__coalesce, self.logger)
         task = asyncio.Task(self.incoming_client_message_cb(client))
         self.clients[task] = client
-        self.__rooms['default'].append(client.nickname)
+        self.__nicknames[client.nickname] = client
+        self.join_room(client, 'default')
 
         client_ip = client_writer.get_extra_info('peername')[0]
         client_port = client_writer.get_extra_info('peername')[1]
         self.logger.info(f"New Connection: {client_ip}:{client_port}")
-        client.writer.write("Write /help".encode('utf8'))
-
-        task.add_done_callback(self.disconnect_client)
 
     async def incoming_client_message_cb(self, client: Client):
-        while True:
-            client_message = await client.get_message()
+        try:
+            await client.negotiate()
+            client.send("Write /help".encode('utf8'))
 
-            if client_message.startswith("quit"):
-                break
-            elif client_message.startswith("/"):
-                self.handle_client_command(client, client_message)
-            else:
-                recipients = None
-                for room in self.__rooms:
-                    if client.nickname in self.__rooms[room]:
-                        recipients = self.__rooms[room]
-                        break
+            while True:
+                client_message = await client.get_message()
 
-                self.broadcast_message(
-                    f"{client.nickname}: {client_message}".encode('utf8'),
-                    inclusion_list=recipients)
+                # Пустое сообщение - соединение закрыто клиентом
+                if not client_message or client_message.startswith("quit"):
+                    break
 
-            self.logger.info(f"{client_message}")
+                self.__metrics.message_received(len(client_message))
+                # После ника и префикса сообщение должно поместиться в кадр у получателей и в истории
+                if len(client_message.encode('utf8')) > MAX_MESSAGE_SIZE:
+                    client.send(f"Message is longer than {MAX_MESSAGE_SIZE} bytes\n".encode('utf8'))
+                elif client_message.startswith("/"):
+                    self.handle_client_command(client, client_message)
+                else:
+                    self.send_to_room(self.get_room(client), f"{client.nickname}: {client_message}")
 
-            await client.writer.drain()
+                self.logger.info(f"{client_message}")
 
-        self.logger.info("Client Disconnected!")
+            self.logger.info("Client Disconnected!")
+        except ConnectionError as e:
+            self.logger.info(f"Connection lost: {e}")
+        finally:
+            self.disconnect_client(asyncio.current_task())
 
     def handle_client_command(self, client: Client, client_message: str):
         client_message = client_message.replace("\n", "").replace("\r", "")
 
         if client_message.startswith("/nick"):
-            user_room = None
-            for room in self.__rooms:
-                if client.nickname in self.__rooms[room]:
-                    user_room = room
-                    break
             split_client_message = client_message.split(" ")
             if len(split_client_message) >= 2:
-                self.__rooms[room].remove(client.nickname)
-                client.nickname = split_client_message[1]
-                self.__rooms[room].append(client.nickname)
-                client.writer.write(
+                nickname = split_client_message[1]
+                if len(nickname.encode('utf8')) > MAX_NICKNAME_SIZE:
+                    client.send(f"Nickname is longer than {MAX_NICKNAME_SIZE} bytes\n".encode('utf8'))
+                    return
+                if self.nickname_taken(nickname, client):
+                    client.send("Nickname already taken\n".encode('utf8'))
+                    return
+                del self.__nicknames[client.nickname]
+                self.publish('nick', old=client.nickname, new=nickname)
+                client.nickname = nickname
+                self.__nicknames[nickname] = client
+                client.send(
                     f"Nickname changed to {client.nickname}\n".encode('utf8'))
                 return
         elif client_message.startswith("/rooms"):
-            rooms = '\n'.join([f"{key}: {value}" for key, value in self.__rooms.items()])
-            client.writer.write(rooms.encode('utf8'))
+            rooms = '\n'.join([f"{key}: {value}" for key, value in self.room_members().items()])
+            client.send(rooms.encode('utf8'))
             return
         elif client_message.startswith("/join"):
             command = client_message.split(' ')
             if len(command) == 2:
-                user_room = None
-                for room in self.__rooms:
-                    if client.nickname in self.__rooms[room]:
-                        user_room = room
-                        break
-                if user_room == command[1]:
-                    client.writer.write("You already in this room\n".encode('utf8'))
+                if self.get_room(client) == command[1]:
+                    client.send("You already in this room\n".encode('utf8'))
                     return
 
-                self.__rooms[user_room].remove(client.nickname)
-                if command[1] not in self.__rooms:
-                    self.__rooms[command[1]] = []
-                self.__rooms[command[1]].append(client.nickname)
-                client.writer.write("Room changed\n".encode('utf8'))
+                self.join_room(client, command[1])
+                client.send("Room changed\n".encode('utf8'))
+                # Последние сообщения комнаты уходят клиенту одной записью
+                client.send_batch(self.__history.recent(command[1]))
                 return
         elif client_message.startswith("/myroom"):
-            user_room = None
-            for room in self.__rooms:
-                if client.nickname in self.__rooms[room]:
-                    user_room = room
-                    break
-            client.writer.write(f"Your room is {room}\n".encode('utf8'))
+            client.send(f"Your room is {self.get_room(client)}\n".encode('utf8'))
             return
         elif client_message.startswith("/personal"):
             command = client_message.split(' ')
             if len(command) > 2:
-                self.broadcast_message(
-                        f"personal:{client.nickname}: {' '.join(command[2:])}".encode('utf8'),
-                    inclusion_list=[client.nickname, command[1]])
+                message = f"personal:{client.nickname}: {' '.join(command[2:])}"
+                recipients = {client}
+                target = self.get_client(command[1])
+                if target is not None:
+                    recipients.add(target)
+                elif command[1] in self.__remote_nicknames:
+                    self.publish('personal', nick=command[1], message=message)
+                self.broadcast_message(message.encode('utf8'), recipients)
                 return
 
+        elif client_message.startswith("/stats"):
+            client.send('\n'.join(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}"
+                                  for key, value in self.stats().items()).encode('utf8'))
+            return
         elif client_message.startswith("/help"):
-                client.writer.write(
+                client.send(
                     '''/nick <nickname> to change nickname
 /rooms to see list of rooms
 /join <room> to join room
 /myroom to see your room
-/personal <nick> <message> to send personal message'''.encode('utf8'))
+/personal <nick> <message> to send personal message
+/stats to see server statistics'''.encode('utf8'))
                 return
 
-        client.writer.write("Invalid Command use /help\n".encode('utf8'))
+        client.send("Invalid Command use /help\n".encode('utf8'))
 
 
-    def broadcast_message(self, message: bytes, inclusion_list: list = []):
-        for client in self.clients.values():
-            if client.nickname in inclusion_list:
-                client.writer.write(message)
+    def broadcast_message(self, message: bytes, recipients=()):
+        # Стоимость зависит только от числа получателей, а не от числа клиентов сервера
+        for client in recipients:
+            client.send(message)
 
     def disconnect_client(self, task: asyncio.Task):
         client = self.clients[task]
 
-        user_room = None
-        for room in self.__rooms:
-            if client.nickname in self.__rooms[room]:
-                self.__rooms[room].remove(client.nickname)
-                break
+        room = self.leave_room(client)
+        self.__nicknames.pop(client.nickname, None)
 
-        self.broadcast_message(
-            f"{client.nickname} has left!".encode('utf8'), [client])
+        if room is not None and not self.__closing:
+            self.send_to_room(room, f"{client.nickname} has left!")
+            self.release_if_empty(room)
 
         del self.clients[task]
-        client.writer.write('quit'.encode('utf8'))
-        client.writer.close()
+        self.__dropped_messages += client.outbox.dropped
+        self.__sent_messages += client.outbox.sent
+        self.__sent_bytes += client.outbox.bytes_sent
+        self.__writes += client.outbox.writes
+        if client.outbox.overflowed and client.outbox.policy == DISCONNECT:
+            self.__slow_disconnects += 1
+            self.logger.warning(f"Slow consumer {client} disconnected")
+        client.send('quit'.encode('utf8'))
+        client.close()
         self.logger.info("End Connection")
 
-    def shutdown_server(self):
+    async def shutdown_server(self, timeout: float = SHUTDOWN_TIMEOUT):
         '''
-        Shuts down server.
+        Shuts down server: every client gets 'quit' after its queued messages,
+        connections still not flushed after `timeout` seconds are aborted.
         '''
         self.logger.info("Shutting down server!")
-        for client in self.clients.values():
-            client.writer.write('quit'.encode('utf8'))
-        self.loop.stop()
+        self.__closing = True
+        clients = list(self.clients.items())
+        for task, _ in clients:
+            task.cancel()
+        await asyncio.gather(*(task for task, _ in clients), return_exceptions=True)
+
+        if clients:
+            _, pending = await asyncio.wait([asyncio.ensure_future(client.outbox.wait_closed())
+                                             for _, client in clients], timeout=timeout)
+            if pending:
+                self.logger.warning(f"{len(pending)} connections not drained in {timeout}s, aborting")
+                for _, client in clients:
+                    client.outbox.abort()
+
+        if self.__bus is not None:
+            self.__bus.close()
+        self.__history.close()
+
+
+def run_worker(ip: str, port: int, max_queued: int, overflow_policy: str, bus_path: str,
+               history_options: dict, metrics_port: int = None, idle_timeout: float = None,
+               loop: str = 'auto'):
+    server = Server(ip, port, max_queued, overflow_policy, bus_path, RoomHistory(**history_options),
+                    metrics_port=metrics_port, idle_timeout=idle_timeout)
+    server.start_server(loop)
+
+
+async def serve_hub(hub_socket):
+    # SIGINT/SIGTERM только останавливают концентратор, воркеров завершает run_workers
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stopping.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass
+    await run_hub(hub_socket, stopping)
+
+
+def run_workers(ip: str, port: int, n_workers: int, max_queued: int = MAX_QUEUED_MESSAGES,
+                overflow_policy: str = DROP_OLDEST, history_options: dict = None, metrics_port: int = None,
+                idle_timeout: float = None, loop: str = 'auto'):
+    '''
+    Starts n_workers server processes on one port (SO_REUSEPORT) and relays
+    room events between them through a bus on a Unix socket. Every worker
+    sees all room messages and keeps its own history log; worker i serves
+    metrics on metrics_port + i.
+    '''
+    history_options = history_options or {}
+    directory = history_options.get('directory')
+    with tempfile.TemporaryDirectory() as bus_dir:
+        bus_path = os.path.join(bus_dir, 'bus.sock')
+        hub_socket = bind_hub_socket(bus_path)
+
+        workers = [multiprocessing.Process(target=run_worker,
+                                           args=(ip, port, max_queued, overflow_policy, bus_path,
+                                                 {**history_options,
+                                                  'directory': directory and os.path.join(directory, f"worker{i}")},
+                                                 metrics_port and metrics_port + i, idle_timeout, loop))
+                   for i in range(n_workers)]
+        # До запуска цикла концентратора SIGTERM тоже приводит в finally, а не убивает процесс сразу
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            for worker in workers:
+                worker.start()
+            asyncio.run(serve_hub(hub_socket))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # SIGTERM запускает у воркеров штатное завершение
+            started = [worker for worker in workers if worker.pid is not None]
+            for worker in started:
+                worker.terminate()
+            for worker in started:
+                worker.join()
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        sys.exit(f"Usage: {sys.argv[0]} HOST_IP PORT")
-
-    loop = asyncio.get_event_loop()
-    server = Server(sys.argv[1], sys.argv[2], loop)
-    server.start_server()
+    parser = argparse.ArgumentParser(description="Chat server")
+    parser.add_argument('ip', metavar='HOST_IP')
+    parser.add_argument('port', metavar='PORT', type=int)
+    parser.add_argument('queue_size', metavar='QUEUE_SIZE', type=int, nargs='?', default=MAX_QUEUED_MESSAGES,
+                        help="outgoing messages queued per client")
+    parser.add_argument('overflow_policy', nargs='?', choices=OVERFLOW_POLICIES, default=DROP_OLDEST,
+                        help="what to do when a client's queue is full")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="worker processes sharing the port")
+    parser.add_argument('--history-dir', default='history',
+                        help="directory of room history logs, empty to keep history in memory only")
+    parser.add_argument('--history-size', type=int, default=HISTORY_SIZE,
+                        help="messages replayed on /join")
+    parser.add_argument('--history-max-messages', type=int, default=None,
+                        help="messages kept on disk per room")
+    parser.add_argument('--history-max-age', type=float, default=None,
+                        help="seconds a message is kept")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve Prometheus metrics over HTTP on this port")
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help="disconnect clients silent for this many seconds")
+    parser.add_argument('--loop', choices=LOOPS, default='auto',
+                        help="event loop; auto uses uvloop when it is installed")
+    args = parser.parse_args()
+
+    history_options = {
+        'size': args.history_size,
+        'max_messages': args.history_max_messages,
+        'max_age': args.history_max_age,
+        'directory': args.history_dir or None,
+    }
+
+    if args.workers > 1:
+        run_workers(args.ip, args.port, args.workers, args.queue_size, args.overflow_policy, history_options,
+                    args.metrics_port, args.idle_timeout, args.loop)
+    else:
+        server = Server(args.ip, args.port, args.queue_size, args.overflow_policy,
+                        history=RoomHistory(**history_options), metrics_port=args.metrics_port,
+                        idle_timeout=args.idle_timeout)
+        server.start_server(args.loop)
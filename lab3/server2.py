@@ -1,9 +1,14 @@
 import asyncio
+import sys
+from protocol import MAX_MESSAGE_SIZE, MAX_NICKNAME_SIZE, accept_stream
+from outbox import Outbox, MAX_QUEUED_MESSAGES, DROP_OLDEST
 
 class AsyncServer:
-    def __init__(self, host, port):
+    def __init__(self, host, port, max_queued=MAX_QUEUED_MESSAGES, overflow_policy=DROP_OLDEST):
         self.host = host
         self.port = port
+        self.max_queued = max_queued
+        self.overflow_policy = overflow_policy
         self.clients = {}
         self.rooms = {}
 
@@ -18,44 +23,63 @@ class AsyncServer:
         addr = writer.get_extra_info('peername')
         print(f'New connection from {addr}')
 
+        # Negotiate framing; legacy clients keep sending lines
+        stream = await accept_stream(reader, writer, lines=True)
+
         # Register new client
-        client_name = await self.register_client(reader, writer)
+        client_name = await self.register_client(stream)
+        if client_name is None:
+            writer.close()
+            return
 
         try:
             while True:
-                data = await reader.readline()
+                data = await stream.read()
                 if not data:
                     break
 
                 message = data.decode().strip()
-                if message.startswith('/'):
+                # The name and prefix added on broadcast must still fit into a frame
+                if len(message.encode()) > MAX_MESSAGE_SIZE:
+                    await self.send_error(client_name, f'Message is longer than {MAX_MESSAGE_SIZE} bytes')
+                elif message.startswith('/'):
                     await self.handle_command(client_name, message)
                 else:
                     await self.send_message(client_name, message)
         except ConnectionResetError:
             pass
         finally:
-            # Unregister client
+            # Unregister client; its outbox closes the connection when flushed
+            outbox = self.clients.get(client_name)
             await self.unregister_client(client_name)
-            writer.close()
+            outbox.close()
             print(f'Connection from {addr} closed')
 
-    async def register_client(self, reader, writer):
+    async def register_client(self, stream):
         # Ask client for username
-        writer.write(b'Enter your name: ')
-        await writer.drain()
+        stream.write(b'Enter your name: ')
+        await stream.drain()
 
         # Wait for client's response
-        client_name = (await reader.readline()).decode().strip()
+        data = await stream.read()
 
-        # Check if username is already taken
-        while client_name in self.clients:
-            writer.write(b'This name is already taken. Enter another name: ')
-            await writer.drain()
-            client_name = (await reader.readline()).decode().strip()
-
-        # Register new client
-        self.clients[client_name] = (reader, writer)
+        # Check if username is already taken or too long
+        while data and (data.decode().strip() in self.clients or len(data.strip()) > MAX_NICKNAME_SIZE):
+            if len(data.strip()) > MAX_NICKNAME_SIZE:
+                stream.write(f'Name is longer than {MAX_NICKNAME_SIZE} bytes. Enter another name: '.encode())
+            else:
+                stream.write(b'This name is already taken. Enter another name: ')
+            await stream.drain()
+            data = await stream.read()
+
+        if not data:
+            return None
+        client_name = data.decode().strip()
+
+        # Register new client; from now on it is written to only through its outbox
+        outbox = Outbox(stream.writer, self.max_queued, self.overflow_policy)
+        outbox.start(stream)
+        self.clients[client_name] = outbox
         print(f'{client_name} has joined the server')
 
         # Put client in default room
@@ -107,4 +131,42 @@ class AsyncServer:
             # Remove client from all other rooms
             for other_room_name, other_room_clients in self.rooms.items():
                 if client_name in other_room_clients and other_room_name != room_name:
-                    other_room_clients.remove(client_n)
+                    other_room_clients.remove(client_name)
+                    await self.send_message_to_room(other_room_name, f'{client_name} has left the room')
+
+            self.rooms[room_name].append(client_name)
+            await self.send_message_to_room(room_name, f'{client_name} has joined the room')
+
+    async def leave_room(self, client_name, room_name):
+        if room_name not in self.rooms or client_name not in self.rooms[room_name]:
+            await self.send_error(client_name, f'You are not in room "{room_name}"')
+        else:
+            self.rooms[room_name].remove(client_name)
+            await self.send_message_to_room(room_name, f'{client_name} has left the room')
+            await self.send_message_to_client(client_name, f'You have left room "{room_name}"')
+
+    async def send_message(self, client_name, message):
+        # Send message to every room the client is in
+        for room_name, room_clients in self.rooms.items():
+            if client_name in room_clients:
+                await self.send_message_to_room(room_name, f'{client_name}: {message}')
+
+    async def send_message_to_room(self, room_name, message):
+        for client_name in self.rooms.get(room_name, []):
+            await self.send_message_to_client(client_name, message)
+
+    async def send_message_to_client(self, client_name, message):
+        # Does not wait for the client, so a slow peer cannot stall the room
+        outbox = self.clients.get(client_name)
+        if outbox is not None:
+            outbox.put(f'{message}\n'.encode())
+
+    async def send_error(self, client_name, message):
+        await self.send_message_to_client(client_name, f'Error: {message}')
+
+
+if __name__ == '__main__':
+    host = sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8888
+    server = AsyncServer(host, port)
+    asyncio.run(server.start())
@@ -0,0 +1,126 @@
+'''
+Benchmark of text preprocessing on a synthetic corpus of VK/Telegram posts.
+Compares the old per-channel pool.map with PreprocessEngine.
+
+Example:
+    python bench.py --posts 1000000 --channels 40 -o bench.json
+'''
+import sys
+import json
+import time
+import random
+import itertools
+import argparse
+import platform
+import multiprocessing
+
+from main import process_messages
+from preprocessing import PreprocessEngine
+
+SYLLABLES = ['ка', 'ро', 'ми', 'на', 'то', 'ле', 'за', 'вы', 'ст', 'пр', 'ol', 'an', 'er', 'in', 'st', 'co']
+STOPWORDS = ['и', 'в', 'не', 'на', 'что', 'это', 'the', 'and', 'of', 'to']
+PUNCTUATION = ['.', ',', '!', '?', ':', '—', '...', '(', ')', '"']
+
+
+def make_corpus(n_posts, n_channels, seed=0):
+    '''
+    {source: {channel: [posts]}} with words from a Zipf-like vocabulary,
+    stopwords, punctuation, hashtags, links and VK mentions in brackets.
+    '''
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))) for _ in range(20000)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    def make_post():
+        n_words = rng.randint(5, 80)
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=n_words)
+        for i in range(n_words):
+            roll = rng.random()
+            if roll < 0.25:
+                words[i] = rng.choice(STOPWORDS)
+            elif roll < 0.35:
+                words[i] += rng.choice(PUNCTUATION)
+            elif roll < 0.37:
+                words[i] = '#' + words[i]
+            elif roll < 0.38:
+                words[i] = f"https://t.me/{words[i]}/{rng.randint(1, 10**6)}"
+            elif roll < 0.385:
+                words[i] = f"[club{rng.randint(1, 10**8)}|{words[i]}]"
+        return ' '.join(words)
+
+    data = {'vk': {}, 'telegram': {}}
+    # Размеры каналов сильно различаются, как и в реальных данных
+    sizes = [rng.paretovariate(1.2) for _ in range(n_channels)]
+    scale = n_posts / sum(sizes)
+    counts = [int(size * scale) for size in sizes]
+    counts[0] += n_posts - sum(counts)
+    for i, count in enumerate(counts):
+        source = 'vk' if i % 2 else 'telegram'
+        channel = 10**7 + i if source == 'vk' else f"@channel{i}"
+        data[source][channel] = [make_post() for _ in range(count)]
+    return data
+
+
+def process_per_channel(data):
+    # Прежний process_data: один pool.map на канал с одноэлементным списком
+    result = {source: {} for source in data}
+    with multiprocessing.Pool() as pool:
+        for source, messages in data.items():
+            for key, value in messages.items():
+                result[source][key] = pool.map(process_messages, [value])[0]
+    return result
+
+
+def run_benchmark(n_posts, n_channels, repeat, processes=None):
+    data = make_corpus(n_posts, n_channels)
+    megabytes = sum(len(post.encode('utf8')) for channels in data.values()
+                    for posts in channels.values() for post in posts) / 2**20
+    print(f"{n_posts} posts, {n_channels} channels, {megabytes:.1f} MB", file=sys.stderr)
+
+    results = {}
+
+    start = time.perf_counter()
+    expected = process_per_channel(data)
+    results['per_channel_s'] = time.perf_counter() - start
+    print(f"  per-channel pool.map: {results['per_channel_s']:.1f}s", file=sys.stderr)
+
+    with PreprocessEngine(process_messages, processes) as engine:
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            processed = engine.run(data)
+            runs.append(time.perf_counter() - start)
+            assert processed == expected, "engine output differs from per-channel processing"
+        # Первый прогон включает запуск пула, последующие - переиспользуют его
+        results['engine_first_s'] = runs[0]
+        results['engine_best_s'] = min(runs)
+        results['processes'] = engine.processes
+    print(f"  engine: first {results['engine_first_s']:.1f}s, best {results['engine_best_s']:.1f}s "
+          f"on {results['processes']} processes", file=sys.stderr)
+
+    return {
+        'posts': n_posts,
+        'channels': n_channels,
+        'megabytes': megabytes,
+        'posts_per_s_per_channel': n_posts / results['per_channel_s'],
+        'posts_per_s_engine': n_posts / results['engine_best_s'],
+        'machine': {'cpu_count': multiprocessing.cpu_count(), 'python': platform.python_version()},
+        **results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark lab4 text preprocessing")
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--channels', type=int, default=40)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('-o', '--output', default=None, help="JSON report path, stdout by default")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.posts, args.channels, args.repeat, args.processes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
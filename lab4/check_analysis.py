@@ -0,0 +1,94 @@
+'''
+Checks the hashtag/keyword split of analyze_messages on hand-made posts and
+times it against the old list-based filtering on growing synthetic corpora.
+
+Example:
+    python check_analysis.py --posts 250 --steps 4
+'''
+import sys
+import argparse
+from collections import Counter
+
+from main import analyze_messages
+from check_tokenizer import best_time
+from tokenizer import Tokenizer
+
+# Пост и ожидаемые слова и хэштеги при стоп-словах STOP_WORDS
+STOP_WORDS = {'и', 'в', 'на'}
+CASES = [
+    ("Новый #Релиз игры! #игры #релиз", ['Новый', 'игры'], ['релиз', 'игры', 'релиз']),
+    ("Релиз перенесли, подробности: https://example.com/news#релиз", ['Релиз', 'перенесли', 'подробности'], []),
+    ("[club1|#реклама] Скидки на игры #скидки", ['Скидки', 'игры'], ['скидки']),
+    ("Цена 100#1 и C# в одном посте", ['Цена', '100', '1', 'C', 'одном', 'посте'], []),
+]
+EXPECTED_HASHTAGS = {'релиз': 2, 'игры': 1, 'скидки': 1}
+# Слова, совпадающие с хэштегами без учета регистра, не считаются ключевыми
+EXPECTED_KEYWORDS = {'Новый': 1, 'перенесли': 1, 'подробности': 1, 'Цена': 1, '100': 1, '1': 1,
+                     'C': 1, 'одном': 1, 'посте': 1}
+
+
+def analyze_messages_list(messages):
+    # Прежний алгоритм: каждое слово ищется в списке всех хэштегов
+    hashtags = [hashtag for words, tags in messages for hashtag in tags]
+    keywords = [word for words, tags in messages for word in words if word.lower() not in hashtags]
+    return dict(Counter(hashtags)), dict(Counter(keywords))
+
+
+def check_cases():
+    tokenizer = Tokenizer(STOP_WORDS)
+    errors = 0
+    messages = []
+    for post, words, hashtags in CASES:
+        tokens = tokenizer.tokenize(post)
+        if tokens != (words, hashtags):
+            errors += 1
+            print(f"{post!r}\n  expected: {(words, hashtags)}\n  got:      {tokens}")
+        messages.append(tokens)
+
+    result = analyze_messages(messages)
+    if result['hashtags'] != EXPECTED_HASHTAGS:
+        errors += 1
+        print(f"hashtags: expected {EXPECTED_HASHTAGS}, got {result['hashtags']}")
+    if result['keywords'] != EXPECTED_KEYWORDS:
+        errors += 1
+        print(f"keywords: expected {EXPECTED_KEYWORDS}, got {result['keywords']}")
+    return errors
+
+
+def run_timing(n_posts, steps, repeat):
+    from bench import make_corpus
+    from main import TOKENIZER
+
+    errors = 0
+    for step in range(steps):
+        size = n_posts * 2 ** step
+        posts = [post for channels in make_corpus(size, 1).values()
+                 for posts in channels.values() for post in posts]
+        messages = [TOKENIZER.tokenize(post) for post in posts]
+        n_words = sum(len(words) for words, hashtags in messages)
+
+        result = analyze_messages(messages, sort=False)
+        if (result['hashtags'], result['keywords']) != analyze_messages_list(messages):
+            errors += 1
+            print(f"{size} posts: result differs from the list-based filtering")
+
+        new_time = best_time(lambda: analyze_messages(messages), repeat)
+        old_time = best_time(lambda: analyze_messages_list(messages), 1)
+        # При линейной сложности время на слово не растет вместе с корпусом
+        print(f"{size} posts, {n_words} words: sets {new_time * 1000:.1f} ms "
+              f"({new_time / n_words * 1e9:.0f} ns/word), lists {old_time * 1000:.1f} ms "
+              f"({old_time / n_words * 1e9:.0f} ns/word)")
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check and time the hashtag/keyword split")
+    parser.add_argument('--posts', type=int, default=250, help="corpus size of the first step")
+    parser.add_argument('--steps', type=int, default=4, help="number of corpus size doublings")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    errors = check_cases()
+    print(f"{len(CASES)} posts checked, {errors} errors")
+    errors += run_timing(args.posts, args.steps, args.repeat)
+    sys.exit(1 if errors else 0)
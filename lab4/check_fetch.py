@@ -0,0 +1,104 @@
+'''
+Runs the VK and Telegram fetchers against a local fake API: checks that
+every post is fetched once, that a second run gets only new posts, that
+concurrency and the request rate stay within limits and that both sources
+are fetched at the same time.
+
+Example:
+    python check_fetch.py --posts 250 --new-posts 30
+'''
+import sys
+import time
+import asyncio
+import argparse
+from aiohttp import web
+
+from fake_api import FakeApi, FakeTelegramClient
+from fetch import VkFetcher, TelegramFetcher, fetch_all, make_session, VK_CONCURRENCY, TELEGRAM_CONCURRENCY
+
+
+def expected_posts(api, last_ids):
+    vk = {group: {(post['id'], post['text']) for post in wall if post['id'] > last_ids['vk'].get(group, 0)}
+          for group, wall in api.walls.items()}
+    telegram = {channel: {(post['id'], post['caption']) for post in history
+                          if post['id'] > last_ids['telegram'].get(channel, 0)}
+                for channel, history in api.histories.items()}
+    return {'vk': vk, 'telegram': telegram}
+
+
+def compare(posts, expected):
+    errors = 0
+    for source, channels in expected.items():
+        for channel, items in channels.items():
+            got = posts[source][channel]
+            if len(got) != len(set(got)) or set(got) != items:
+                errors += 1
+                print(f"{source} {channel}: got {len(got)} posts, expected {len(items)}")
+    return errors
+
+
+def overlap(api):
+    vk_start, vk_end = min(start for start, end in api.requests['vk']), max(end for start, end in api.requests['vk'])
+    telegram_start = min(start for start, end in api.requests['telegram'])
+    telegram_end = max(end for start, end in api.requests['telegram'])
+    return min(vk_end, telegram_end) - max(vk_start, telegram_start)
+
+
+async def run_check(args):
+    groups = list(range(1, args.groups + 1))
+    channels = [f"@channel{i}" for i in range(1, args.channels + 1)]
+    api = FakeApi(groups, channels, args.posts, args.rate, args.failure_rate)
+    runner = web.AppRunner(api.app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{runner.addresses[0][1]}/"
+
+    errors = 0
+    last_ids = {'vk': {}, 'telegram': {}}
+    try:
+        # Оба источника ходят на один адрес, поэтому пул соединений общий на двоих
+        async with make_session(VK_CONCURRENCY + TELEGRAM_CONCURRENCY) as session:
+            for run, new_posts in enumerate([0, args.new_posts]):
+                api.add_posts(new_posts)
+                expected = expected_posts(api, last_ids)
+                vk = VkFetcher(session, 'token', rate=args.rate, base_url=base_url + 'method/')
+                telegram = TelegramFetcher(FakeTelegramClient(session, base_url))
+
+                start = time.perf_counter()
+                posts = await fetch_all(vk, telegram, groups, channels, last_ids)
+                elapsed = time.perf_counter() - start
+                errors += compare(posts, expected)
+                fetched = sum(len(items) for channels in posts.values() for items in channels.values())
+                print(f"run {run + 1}: {fetched} posts in {elapsed:.2f}s")
+
+                for source, channels in posts.items():
+                    for channel, items in channels.items():
+                        if items:
+                            last_ids[source][channel] = max(post_id for post_id, text in items)
+    finally:
+        await runner.cleanup()
+
+    if api.max_in_flight['vk'] > VK_CONCURRENCY or api.max_in_flight['telegram'] > TELEGRAM_CONCURRENCY:
+        errors += 1
+    if overlap(api) <= 0:
+        errors += 1
+        print("VK and Telegram were not fetched at the same time")
+    print(f"in flight at most: vk {api.max_in_flight['vk']}, telegram {api.max_in_flight['telegram']}; "
+          f"overlap {overlap(api):.2f}s; {api.failures} injected failures, {api.rate_errors} rate limit errors")
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check fetchers against the fake API")
+    parser.add_argument('--groups', type=int, default=4)
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--posts', type=int, default=250)
+    parser.add_argument('--new-posts', type=int, default=30)
+    parser.add_argument('--rate', type=int, default=10, help="VK requests per second")
+    parser.add_argument('--failure-rate', type=float, default=0.2)
+    args = parser.parse_args()
+
+    errors = asyncio.run(run_check(args))
+    print(f"{errors} errors")
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,113 @@
+'''
+Checks AnalyticsState against analyze_messages over all posts of each
+channel at once, whatever batches they were merged in, its reload
+from the journal and from a compacted snapshot, and shows that a refresh
+costs the same while history grows.
+
+Example:
+    python check_state.py --posts 20000 --batches 20
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+from collections import Counter
+
+from bench import make_corpus
+from main import TOKENIZER, analyze_messages
+from state import AnalyticsState
+
+
+def make_batches(n_posts, n_channels, n_batches):
+    # Посты каждого канала делятся на n_batches порций, как при периодических обновлениях
+    batches = [[] for _ in range(n_batches)]
+    for source, channels in make_corpus(n_posts, n_channels).items():
+        for channel, posts in channels.items():
+            messages = [TOKENIZER.tokenize(post) for post in posts]
+            size = len(messages) // n_batches + 1
+            for i in range(n_batches):
+                batches[i].append((source, channel, messages[i * size:(i + 1) * size], (i + 1) * size))
+    return batches
+
+
+def recount(batches):
+    # Полный пересчет без состояния: analyze_messages по всем постам канала сразу
+    messages = {}
+    for batch in batches:
+        for source, channel, channel_messages, last_id in batch:
+            messages.setdefault((source, channel), []).extend(channel_messages)
+    channels = {}
+    for key, channel_messages in messages.items():
+        result = analyze_messages(channel_messages, sort=False)
+        channels[key] = (Counter(result['keywords']), Counter(result['hashtags']))
+    totals = {}
+    for (source, channel), (keywords, hashtags) in channels.items():
+        for scope in (source, None):
+            total = totals.setdefault(scope, [Counter(), Counter()])
+            total[0].update(keywords)
+            total[1].update(hashtags)
+    return channels, totals
+
+
+def top_counts(counts, k=10):
+    return [count for key, count in counts.most_common(k)]
+
+
+def compare(report, channels, totals):
+    errors = 0
+    scopes = [(report, totals[None])] + [(report[source], totals[source]) for source in totals if source]
+    for scope, (keywords, hashtags) in scopes:
+        if list(scope['common_keywords'].values()) != top_counts(keywords):
+            errors += 1
+        if list(scope['common_hashtags'].values()) != top_counts(hashtags):
+            errors += 1
+    for (source, channel), (keywords, hashtags) in channels.items():
+        if list(report[source][channel]['keywords'].values()) != top_counts(keywords):
+            errors += 1
+        if list(report[source][channel]['hashtags'].values()) != top_counts(hashtags):
+            errors += 1
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check incremental analytics state")
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--channels', type=int, default=10)
+    parser.add_argument('--batches', type=int, default=20)
+    args = parser.parse_args()
+
+    batches = make_batches(args.posts, args.channels, args.batches)
+    channels, totals = recount(batches)
+
+    errors = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'analytics')
+        with AnalyticsState(path) as state:
+            history = []
+            for i, batch in enumerate(batches):
+                start = time.perf_counter()
+                for source, channel, messages, last_id in batch:
+                    state.merge(source, channel, messages, last_id)
+                report = state.report()
+                merge_time = time.perf_counter() - start
+                history.extend(batch)
+
+                # Прежний путь: пересчет всей накопленной истории на каждом обновлении
+                start = time.perf_counter()
+                recount([history])
+                recount_time = time.perf_counter() - start
+                print(f"batch {i + 1}: merge {merge_time * 1000:.1f} ms, full recount {recount_time * 1000:.1f} ms")
+            errors += compare(report, channels, totals)
+            last_ids = state.last_ids('vk')
+
+        with AnalyticsState(path) as state:
+            errors += compare(state.report(), channels, totals)
+            if state.last_ids('vk') != last_ids:
+                errors += 1
+            state.compact()
+        with AnalyticsState(path) as state:
+            errors += compare(state.report(), channels, totals)
+
+    print(f"{len(channels)} channels, {args.batches} batches, {errors} errors")
+    sys.exit(1 if errors else 0)
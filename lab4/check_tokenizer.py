@@ -0,0 +1,134 @@
+'''
+Checks that Tokenizer gives the same tokens as the nltk pipeline it
+replaced and that it is at least --min-speedup times faster. Hashtags are
+taken out of the text before both, the old pipeline only split them into
+words. The check needs only nltk, without its data: sentences are split by
+punkt without the trained model, as Tokenizer does. The speedup is measured
+on a synthetic corpus, large enough for a stable result.
+
+Example:
+    python check_tokenizer.py fixtures/posts.json
+    python check_tokenizer.py --synthetic 20000 --no-timing
+'''
+import re
+import sys
+import json
+import time
+import argparse
+import nltk
+from itertools import chain
+from nltk.tokenize import NLTKWordTokenizer
+from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+from tokenizer import Tokenizer, NLTK_VERSION
+
+MIN_SPEEDUP = 10
+TIMING_POSTS = 2000
+# Часть стоп-слов main.py: результат сравнения от набора стоп-слов не зависит
+STOP_WORDS = {'и', 'в', 'не', 'на', 'что', 'это', 'the', 'and', 'of', 'to', 'a', 'i', '❤️', '❤', ':', 'https'}
+TOKENIZER = Tokenizer(STOP_WORDS)
+
+# nltk.word_tokenize: punkt, затем NLTKWordTokenizer для каждого предложения
+SENTENCE_TOKENIZER = PunktSentenceTokenizer()
+WORD_TOKENIZER = NLTKWordTokenizer()
+
+
+def word_tokenize(text):
+    return [token for sentence in SENTENCE_TOKENIZER.tokenize(text) for token in WORD_TOKENIZER.tokenize(sentence)]
+
+
+def remove_stopwords(text):
+    text = re.sub(r'\[.*?\]', '', text)
+    text = re.sub(r'http\S+', '', text)
+    words = text.split()
+    filtered_words = [word for word in words
+                      if word.strip().lower() not in STOP_WORDS]
+    return ' '.join(filtered_words)
+
+
+def remove_punctuation(text):
+    words = word_tokenize(text)
+    words_without_punct = [word for word in words if word.isalnum()]
+    return ' '.join(words_without_punct)
+
+
+def reference_tokens(messages):
+    # Прежний конвейер: очистка каждого сообщения и повторная токенизация всего текста в analyze_messages
+    processed = [remove_punctuation(remove_stopwords(TOKENIZER.clean(message)[0])) for message in messages]
+    return processed, word_tokenize(' '.join(processed))
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare_times(old, new, repeat):
+    # Замеры чередуются, чтобы фоновая нагрузка сказывалась на обоих одинаково
+    old_times, new_times = [], []
+    for _ in range(repeat):
+        old_times.append(best_time(old, 1))
+        new_times.append(best_time(new, 1))
+    return min(old_times), min(new_times)
+
+
+def synthetic_posts(n_posts):
+    from bench import make_corpus
+    return [post for channels in make_corpus(n_posts, 10).values()
+            for posts in channels.values() for post in posts]
+
+
+def check_tokens(messages):
+    processed, expected = reference_tokens(messages)
+    tokens = [TOKENIZER.tokenize(message)[0] for message in messages]
+    mismatches = 0
+    for message, old, new in zip(messages, processed, tokens):
+        if old.split() != new:
+            mismatches += 1
+            print(f"{message!r}\n  nltk:      {old.split()}\n  tokenizer: {new}")
+    if list(chain.from_iterable(tokens)) != expected:
+        mismatches += 1
+        print("Token stream of the whole corpus differs")
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare Tokenizer with the nltk pipeline")
+    parser.add_argument('fixture', nargs='?', default='fixtures/posts.json', help="JSON list of posts")
+    parser.add_argument('--synthetic', type=int, default=0, help="check that many generated posts instead")
+    parser.add_argument('--timing-posts', type=int, default=TIMING_POSTS,
+                        help="generated posts to time, 0 to time the checked posts")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-speedup', type=float, default=MIN_SPEEDUP, help="fail below that speedup")
+    parser.add_argument('--no-timing', action='store_true', help="only compare tokens, e.g. in CI")
+    args = parser.parse_args()
+
+    if nltk.__version__ != NLTK_VERSION:
+        print(f"nltk {nltk.__version__} is installed, Tokenizer rules were copied from nltk {NLTK_VERSION}")
+
+    if args.synthetic:
+        messages = synthetic_posts(args.synthetic)
+    else:
+        with open(args.fixture, encoding='utf-8') as f:
+            messages = json.load(f)
+
+    mismatches = check_tokens(messages)
+    print(f"{len(messages)} posts, {mismatches} mismatches")
+    if args.no_timing:
+        sys.exit(1 if mismatches else 0)
+
+    # На нескольких десятках постов время в пределах миллисекунды, и отношение скачет от запуска к запуску
+    timing_messages = synthetic_posts(args.timing_posts) if args.timing_posts else messages
+    old_time, new_time = compare_times(lambda: reference_tokens(timing_messages),
+                                       lambda: [TOKENIZER.tokenize(message) for message in timing_messages],
+                                       args.repeat)
+    speedup = old_time / new_time
+    print(f"{len(timing_messages)} posts timed: nltk pipeline {old_time * 1000:.1f} ms, "
+          f"tokenizer {new_time * 1000:.1f} ms, {speedup:.1f}x faster")
+    if speedup < args.min_speedup:
+        print(f"Speedup is below {args.min_speedup:g}x")
+    sys.exit(1 if mismatches or speedup < args.min_speedup else 0)
@@ -0,0 +1,152 @@
+'''
+Local fake of VK wall.get and of Telegram channel history for checking the
+fetchers without network access. It pages, limits the request rate, fails
+at random and records how many requests of each source were in flight.
+
+Example:
+    python fake_api.py --port 8080 --posts 500
+'''
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+from types import SimpleNamespace
+from aiohttp import web
+from pyrogram.errors import FloodWait
+
+VK_PAGE = 100
+TELEGRAM_PAGE = 100
+FLOOD_WAIT = 1
+
+
+class FakeApi:
+    '''
+    aiohttp application with /method/wall.get and /telegram/history. Post ids
+    of every wall and channel grow from 1, the oldest post of a wall is
+    pinned and comes first, as in VK.
+    '''
+    def __init__(self, groups, channels, posts, rate=3, failure_rate=0.1, latency=0.02, seed=0):
+        self.rng = random.Random(seed)
+        self.walls = {group: [] for group in groups}
+        self.histories = {channel: [] for channel in channels}
+        self.rate = rate
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.add_posts(posts)
+
+        # Интервалы (начало, конец) обработанных запросов и пиковое число одновременных
+        self.requests = {'vk': [], 'telegram': []}
+        self.in_flight = {'vk': 0, 'telegram': 0}
+        self.max_in_flight = {'vk': 0, 'telegram': 0}
+        self.failures = 0
+        self.rate_errors = 0
+        self.__recent = deque()
+
+        self.app = web.Application()
+        self.app.router.add_get('/method/wall.get', self.wall_get)
+        self.app.router.add_get('/telegram/history', self.history)
+
+    def add_posts(self, count):
+        for group, wall in self.walls.items():
+            for _ in range(count):
+                post_id = len(wall) + 1
+                wall.append({'id': post_id, 'text': f"Пост {post_id} группы {group} #тег{post_id % 7}"})
+        for channel, history in self.histories.items():
+            for _ in range(count):
+                post_id = len(history) + 1
+                caption = f"Пост {post_id} канала {channel}" if self.rng.random() > 0.1 else None
+                history.append({'id': post_id, 'caption': caption})
+
+    async def serve(self, source, handler, request):
+        start = time.perf_counter()
+        self.in_flight[source] += 1
+        self.max_in_flight[source] = max(self.max_in_flight[source], self.in_flight[source])
+        try:
+            await asyncio.sleep(self.latency)
+            return handler(request)
+        finally:
+            self.in_flight[source] -= 1
+            self.requests[source].append((start, time.perf_counter()))
+
+    async def wall_get(self, request):
+        return await self.serve('vk', self.handle_wall_get, request)
+
+    async def history(self, request):
+        return await self.serve('telegram', self.handle_history, request)
+
+    def handle_wall_get(self, request):
+        now = time.monotonic()
+        while self.__recent and self.__recent[0] <= now - 1:
+            self.__recent.popleft()
+        if len(self.__recent) >= self.rate:
+            self.rate_errors += 1
+            return web.json_response({'error': {'error_code': 6, 'error_msg': "Too many requests per second"}})
+        self.__recent.append(now)
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            return web.Response(status=500)
+
+        query = request.query
+        group = -int(query['owner_id'])
+        if group not in self.walls:
+            return web.json_response({'error': {'error_code': 100, 'error_msg': "Invalid owner_id"}})
+        wall = self.walls[group]
+        pinned = dict(wall[0], is_pinned=1)
+        items = [pinned] + wall[:0:-1]
+        offset = int(query.get('offset', 0))
+        count = min(int(query.get('count', 20)), VK_PAGE)
+        return web.json_response({'response': {'count': len(items), 'items': items[offset:offset + count]}})
+
+    def handle_history(self, request):
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            return web.json_response({'flood_wait': FLOOD_WAIT}, status=420)
+
+        query = request.query
+        history = self.histories[query['chat']]
+        offset_id = int(query.get('offset_id', 0))
+        limit = min(int(query.get('limit', TELEGRAM_PAGE)), TELEGRAM_PAGE)
+        end = offset_id - 1 if offset_id else len(history)
+        return web.json_response({'messages': history[max(end - limit, 0):end][::-1]})
+
+
+class FakeTelegramClient:
+    '''
+    Stands in for pyrogram.Client in TelegramFetcher: get_chat_history over
+    the /telegram/history of FakeApi.
+    '''
+    def __init__(self, session, base_url):
+        self.__session = session
+        self.__base_url = base_url
+
+    async def get_chat_history(self, chat_id, limit=0, offset_id=0):
+        received = 0
+        while not limit or received < limit:
+            page = min(TELEGRAM_PAGE, limit - received) if limit else TELEGRAM_PAGE
+            params = {'chat': chat_id, 'offset_id': offset_id, 'limit': page}
+            async with self.__session.get(self.__base_url + 'telegram/history', params=params) as response:
+                data = await response.json()
+                if response.status == 420:
+                    raise FloodWait(value=data['flood_wait'])
+            if not data['messages']:
+                return
+            for message in data['messages']:
+                yield SimpleNamespace(id=message['id'], caption=message['caption'])
+                received += 1
+                offset_id = message['id']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake VK and Telegram API")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--groups', type=int, default=4)
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--rate', type=int, default=3)
+    parser.add_argument('--failure-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    api = FakeApi(range(1, args.groups + 1), [f"@channel{i}" for i in range(1, args.channels + 1)],
+                  args.posts, args.rate, args.failure_rate)
+    web.run_app(api.app, host='127.0.0.1', port=args.port)
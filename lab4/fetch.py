@@ -0,0 +1,217 @@
+import random
+import asyncio
+import logging
+import aiohttp
+from pyrogram.errors import FloodWait, RPCError
+
+VK_API = 'https://api.vk.com/method/'
+VK_VERSION = '5.131'
+# wall.get отдает не больше 100 постов за запрос
+VK_PAGE = 100
+# Пользовательскому токену VK разрешено 3 запроса в секунду
+VK_RATE = 3
+VK_CONCURRENCY = 3
+# Too many requests per second, Flood control, Internal server error
+VK_RETRY_CODES = frozenset([6, 9, 10])
+TELEGRAM_CONCURRENCY = 4
+
+# Постов одного канала за запуск: первый запуск берет последние MAX_POSTS
+MAX_POSTS = 1000
+ATTEMPTS = 5
+BACKOFF = 0.5
+TIMEOUT = 30
+
+logger = logging.getLogger(__name__)
+
+
+class RetryableError(Exception):
+    '''
+    Temporary failure, the same request may succeed later.
+    '''
+
+
+class VkApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"VK error {code}: {message}")
+        self.code = code
+
+
+async def retry(request, attempts=ATTEMPTS, backoff=BACKOFF):
+    '''
+    Awaits request() until it succeeds, sleeping with exponential backoff
+    and jitter after temporary failures.
+    '''
+    for attempt in range(attempts):
+        try:
+            return await request()
+        except (RetryableError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+            if attempt == attempts - 1:
+                raise
+            # Случайная доля задержки разводит повторы параллельных запросов
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1)
+            logger.info(f"{e!r}, retry in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    '''
+    Spreads calls of wait() evenly, at most rate per second.
+    '''
+    def __init__(self, rate):
+        self.__interval = 1 / rate
+        self.__next = 0.0
+
+    async def wait(self):
+        # Каждый вызов занимает следующий свободный интервал и ждет его без блокировки остальных
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.__next)
+        self.__next = start + self.__interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class VkFetcher:
+    '''
+    Posts of VK groups through wall.get on a shared aiohttp session, with at
+    most `concurrency` requests in flight and at most `rate` started per
+    second.
+    '''
+    def __init__(self, session, access_token, concurrency=VK_CONCURRENCY, rate=VK_RATE, base_url=VK_API):
+        self.__session = session
+        self.__access_token = access_token
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__limiter = RateLimiter(rate)
+        self.__base_url = base_url
+
+    async def call(self, method, **params):
+        params = {**params, 'access_token': self.__access_token, 'v': VK_VERSION}
+
+        async def request():
+            async with self.__semaphore:
+                await self.__limiter.wait()
+                async with self.__session.get(self.__base_url + method, params=params) as response:
+                    if response.status == 429 or response.status >= 500:
+                        raise RetryableError(f"HTTP {response.status}")
+                    if response.status != 200:
+                        raise VkApiError(response.status, response.reason)
+                    data = await response.json(content_type=None)
+            if 'error' in data:
+                error = data['error']
+                if error['error_code'] in VK_RETRY_CODES:
+                    raise RetryableError(f"VK error {error['error_code']}: {error['error_msg']}")
+                raise VkApiError(error['error_code'], error['error_msg'])
+            return data['response']
+
+        return await retry(request)
+
+    async def fetch_group(self, group, last_id=0, max_posts=MAX_POSTS):
+        '''
+        [(id, text)] of posts newer than last_id, newest first.
+        '''
+        posts = []
+        seen = set()
+        offset = 0
+        while len(posts) < max_posts:
+            response = await self.call('wall.get', owner_id=-group, offset=offset, count=VK_PAGE)
+            items = response['items']
+            for item in items:
+                # Закрепленный пост идет первым, даже если он старше остальных
+                if item['id'] <= last_id and not item.get('is_pinned'):
+                    return posts[:max_posts]
+                # Новый пост во время листания сдвигает страницы, и последний пост страницы повторяется
+                if item['id'] > last_id and item['id'] not in seen:
+                    seen.add(item['id'])
+                    posts.append((item['id'], item['text']))
+            offset += len(items)
+            if not items or offset >= response['count']:
+                break
+        return posts[:max_posts]
+
+    async def fetch(self, group_ids, last_ids):
+        '''
+        {group: [(id, text)]}. A group that failed gets an empty list, so its
+        last id stays and the next run fetches it again.
+        '''
+        async def fetch_group(group):
+            try:
+                return await self.fetch_group(group, last_ids.get(group, 0))
+            except (VkApiError, RetryableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"VK group {group}: {e!r}")
+                return []
+
+        posts = await asyncio.gather(*(fetch_group(group) for group in group_ids))
+        return dict(zip(group_ids, posts))
+
+
+class TelegramFetcher:
+    '''
+    Posts of Telegram channels through a started pyrogram Client, at most
+    `concurrency` channels at a time. FloodWait is waited out as the server
+    asks and the history is resumed from the last received post.
+    '''
+    def __init__(self, client, concurrency=TELEGRAM_CONCURRENCY, attempts=ATTEMPTS, backoff=BACKOFF):
+        self.__client = client
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__attempts = attempts
+        self.__backoff = backoff
+
+    async def fetch_channel(self, channel, last_id=0, max_posts=MAX_POSTS):
+        '''
+        [(id, caption)] of posts newer than last_id, newest first. Caption
+        is None for posts without it.
+        '''
+        posts = []
+        offset_id = 0
+        for attempt in range(self.__attempts):
+            try:
+                async with self.__semaphore:
+                    # История идет от новых постов к старым, offset_id продолжает ее после сбоя
+                    async for post in self.__client.get_chat_history(
+                            channel, limit=max_posts - len(posts), offset_id=offset_id):
+                        if post.id <= last_id:
+                            return posts
+                        posts.append((post.id, post.caption))
+                        offset_id = post.id
+                return posts
+            except FloodWait as e:
+                if attempt == self.__attempts - 1:
+                    raise
+                logger.info(f"Telegram {channel}: flood wait {e.value}s")
+                await asyncio.sleep(e.value)
+            except (OSError, asyncio.TimeoutError) as e:
+                if attempt == self.__attempts - 1:
+                    raise
+                delay = self.__backoff * 2 ** attempt * random.uniform(0.5, 1)
+                logger.info(f"Telegram {channel}: {e!r}, retry in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        return posts
+
+    async def fetch(self, channel_names, last_ids):
+        '''
+        {channel: [(id, caption)]}, an empty list for a channel that failed.
+        '''
+        async def fetch_channel(channel):
+            try:
+                return await self.fetch_channel(channel, last_ids.get(channel, 0))
+            except (RPCError, OSError, asyncio.TimeoutError) as e:
+                logger.warning(f"Telegram channel {channel}: {e!r}")
+                return []
+
+        posts = await asyncio.gather(*(fetch_channel(channel) for channel in channel_names))
+        return dict(zip(channel_names, posts))
+
+
+def make_session(concurrency=VK_CONCURRENCY, timeout=TIMEOUT):
+    # Одна сессия на запуск: соединения с API переиспользуются между запросами
+    return aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout),
+                                 connector=aiohttp.TCPConnector(limit_per_host=concurrency))
+
+
+async def fetch_all(vk_fetcher, telegram_fetcher, group_ids, channel_names, last_ids):
+    '''
+    {'vk': {group: posts}, 'telegram': {channel: posts}}, both sources fetched
+    at the same time.
+    '''
+    vk, telegram = await asyncio.gather(vk_fetcher.fetch(group_ids, last_ids['vk']),
+                                        telegram_fetcher.fetch(channel_names, last_ids['telegram']))
+    return {'vk': vk, 'telegram': telegram}
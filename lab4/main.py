@@ -3,19 +3,17 @@ Example input:
     @ru2ch, @rian_ru, @meduzalive, @varlamov_news, @SolovievLive, @lentachold, @vcnews, @rtnews
     112510789, 15755094, 26284064, 31480508, 22751485, 18901857
 '''
-import re
 import json
-import requests
-import threading
-import multiprocessing
-import string
-import nltk
+import asyncio
 import tkinter as tk
 from pyrogram import Client
 from nltk.corpus import stopwords
-from collections import Counter
 
 from constants import *
+from preprocessing import PreprocessEngine
+from tokenizer import Tokenizer
+from state import AnalyticsState, count_messages
+from fetch import VkFetcher, TelegramFetcher, fetch_all, make_session
 
 
 DATA = {
@@ -23,87 +21,60 @@ DATA = {
         'telegram': {}
         }
 
+# id самого нового полученного поста каждого канала, по нему следующий запуск берет только новые
+LAST_IDS = {
+        'vk': {},
+        'telegram': {}
+        }
+
+STATE_PATH = 'analytics'
+
 
 bad_symb = set(['❤️', '❤', ':', 'https', 'это'])
 
 stop_words = set(stopwords.words('russian')).union(set(stopwords.words('english'))).union(bad_symb)
 
-def get_channel_messages(api_id, api_hash, channel_names):
-    data = {}
-    with Client("acc", api_id, api_hash) as app:
-        for channel in channel_names:
-            data[channel] = []
-            channel_info = app.get_chat(channel)
-            for post in app.get_chat_history(channel_info.id, limit=100):
-                if post.caption:
-                    data[channel].append(post.caption)
-    DATA['telegram'] = data
-
-
-def get_group_messages(access_token, group_ids):
-    messages = {}
-    for group in group_ids:
-        messages[group] = []
-        response = requests.get(f"https://api.vk.com/method/wall.get?owner_id=-{group}&access_token={access_token}&v=5.131")
-        if response.status_code == 200:
-            data = response.json()
-            for item in data["response"]["items"]:
-                messages[group].append(item["text"])
-    DATA['vk'] = messages
-
-
-def get_data_in_parallel(telegram_func, *functions):
-    threads = []
-    telegram_func()
-    for function in functions:
-        thread = threading.Thread(target=function)
-        thread.start()
-        threads.append(thread)
-    for thread in threads:
-        thread.join()
-
-
-def remove_stopwords(text):
-    text = re.sub(r'\[.*?\]', '', text)
-    text = re.sub(r'http\S+', '', text)
-    words = text.split()
-    filtered_words = [word for word in words 
-                      if word.strip().lower() not in stop_words]
-    return ' '.join(filtered_words)
-
-
-def remove_punctuation_test(text):
-    translator = str.maketrans('', '', string.punctuation)
-    return text.translate(translator)
-
-def remove_punctuation(text):
-    words = nltk.word_tokenize(text)
-    words_without_punct = [word for word in words if word.isalnum()]
-    return ' '.join(words_without_punct)
+TOKENIZER = Tokenizer(stop_words)
+
+def store_posts(posts):
+    # Посты приходят как (id, текст), новые первыми; пустые тексты только сдвигают последний id
+    for source, channels in posts.items():
+        DATA[source] = {}
+        for channel, items in channels.items():
+            DATA[source][channel] = [text for post_id, text in items if text]
+            if items:
+                LAST_IDS[source][channel] = max(post_id for post_id, text in items)
 
 
+async def fetch_data(group_ids, channel_names, last_ids):
+    async with make_session() as session, Client("acc", teleapi_id, teleapi_hash) as app:
+        return await fetch_all(VkFetcher(session, vk_token), TelegramFetcher(app),
+                               group_ids, channel_names, last_ids)
+
 
 def process_messages(messages):
-    return [remove_punctuation(remove_stopwords(message)) for message in messages]
+    return [TOKENIZER.tokenize(message) for message in messages]
+
+
+# Пул процессов создается при первой обработке и переиспользуется между запусками
+ENGINE = None
+
+
+def get_engine():
+    global ENGINE
+    if ENGINE is None:
+        ENGINE = PreprocessEngine(process_messages)
+    return ENGINE
 
 
-def process_data(data):
-    with multiprocessing.Pool() as pool:
-        for source, messages in data.items():
-            for key, value in messages.items():
-                messages[key] = pool.map(process_messages, [value])[0]
+def process_data(data, engine=None):
+    processed = (engine or get_engine()).run(data)
+    for source, messages in processed.items():
+        data[source].update(messages)
 
 
 def analyze_messages(messages, sort=True):
-    text = ' '.join(messages)
-    
-    words = nltk.tokenize.word_tokenize(text)
-    
-    hashtags = [word[1:] for word in words if word.startswith('#')]
-    keywords = [word for word in words if word.lower() not in hashtags]
-    
-    hashtag_counts = Counter(hashtags)
-    keyword_counts = Counter(keywords)
+    keyword_counts, hashtag_counts = count_messages(messages)
     
     topics = [topic for topic, count in keyword_counts.most_common(10)]
 
@@ -122,34 +93,22 @@ def analyze_messages(messages, sort=True):
     }
 
 
-def analyze(data):
-    result = {
-            "common_keywords": Counter(),
-            "common_hashtags": Counter()
-            }
-    for media, source in data.items():
-        result[media] = {
-                "common_keywords": Counter(),
-                "common_hashtags": Counter()
-                }
-        for channel, messages in source.items():
-            analyzed_messages = analyze_messages(messages)
-            result[media][channel] = analyzed_messages
-            result[media]['common_keywords'] += Counter(analyzed_messages['keywords'])
-            result[media]['common_hashtags'] += Counter(analyzed_messages['hashtags'])
-
-        
-        result['common_keywords'] += result[media]['common_keywords']
-        result['common_hashtags'] += result[media]['common_hashtags']
-
-        result[media]['common_topics'] = [topic for topic, count in result[media]['common_keywords'].most_common(10)]
-        result[media]['common_keywords'] = dict(result[media]['common_keywords'].most_common())
-        result[media]['common_hashtags'] = dict(result[media]['common_hashtags'].most_common())
-    result['common_topics'] = [topic for topic, count in result['common_keywords'].most_common(10)]
-    result['common_keywords'] = dict(result['common_keywords'].most_common())
-    result['common_hashtags'] = dict(result['common_hashtags'].most_common())
-
-    return result
+# Состояние аналитики загружается при первом запуске и дополняется новыми постами
+STATE = None
+
+
+def get_state():
+    global STATE
+    if STATE is None:
+        STATE = AnalyticsState(STATE_PATH)
+    return STATE
+
+
+def update_state(state, data, last_ids):
+    for source, channels in data.items():
+        for channel, messages in channels.items():
+            state.merge(source, channel, messages, last_ids[source].get(channel))
+
 
 def save_res_to_file(data, filename):
     with open(f'{filename}.json', 'w', encoding='utf-8') as f:
@@ -173,15 +132,16 @@ def start():
     else:
         result_text.insert(tk.END, "Введите название id вк групп")
 
-    vk_messages = lambda: get_group_messages(vk_token, vk_id)
-
-    tele_messages = lambda: get_channel_messages(teleapi_id, teleapi_hash, tg_ch)
-    get_data_in_parallel(tele_messages, vk_messages)
+    state = get_state()
+    last_ids = {'vk': state.last_ids('vk'), 'telegram': state.last_ids('telegram')}
+    store_posts(asyncio.run(fetch_data(vk_id, tg_ch, last_ids)))
+    # Обрабатываются только новые посты, их счетчики добавляются к накопленным
     process_data(DATA)
-    
-    result = analyze(DATA)
+    update_state(state, DATA, LAST_IDS)
+
+    result = state.report()
     save_res_to_file(result, 'dump')
-    result_str = "- Common Topics:\n" + '\n'.join(result["common_topics"]) + "\n- Common Topics vk:\n" + '\n'.join(result['vk']["common_topics"]) + "\n- Common Topics telegram:\n" + '\n'.join(result['telegram']["common_topics"])
+    result_str = "- Common Topics:\n" + '\n'.join(result["common_topics"]) + "\n- Common Topics vk:\n" + '\n'.join(result.get('vk', {}).get("common_topics", [])) + "\n- Common Topics telegram:\n" + '\n'.join(result.get('telegram', {}).get("common_topics", []))
 
     result_text.insert(tk.END, result_str)
 
@@ -0,0 +1,99 @@
+import multiprocessing
+
+# Целевой объем текста в одной задаче пула: несколько задач на процесс для
+# балансировки, но не настолько мелко, чтобы упереться в pickle
+CHUNKS_PER_PROCESS = 4
+MIN_CHUNK_CHARS = 64 * 1024
+
+
+def process_chunk(func, segments):
+    # Сегмент - подряд идущие сообщения одного канала: (источник, канал, начало, сообщения)
+    return [(source, channel, start, func(messages)) for source, channel, start, messages in segments]
+
+
+def make_chunks(data, chunk_chars):
+    '''
+    Splits messages of all sources and channels into chunks of about
+    chunk_chars characters. A chunk may hold the tail of one channel and the
+    head of the next, so small channels do not become tiny tasks.
+    '''
+    chunks = []
+    segments = []
+    size = 0
+    for source, channels in data.items():
+        for channel, messages in channels.items():
+            start = 0
+            for i, message in enumerate(messages):
+                size += len(message)
+                if size >= chunk_chars:
+                    segments.append((source, channel, start, messages[start:i + 1]))
+                    chunks.append(segments)
+                    segments = []
+                    size = 0
+                    start = i + 1
+            if start < len(messages):
+                segments.append((source, channel, start, messages[start:]))
+    if segments:
+        chunks.append(segments)
+    return chunks
+
+
+class PreprocessEngine:
+    '''
+    Applies func (list of messages -> list of results) to every channel of
+    {source: {channel: [messages]}} on a process pool that is created once
+    and reused across runs. Work is split by text volume, not by channel, and
+    results come back in the original order of each channel.
+    '''
+    def __init__(self, func, processes=None, min_chunk_chars=MIN_CHUNK_CHARS):
+        self.__func = func
+        self.__processes = processes or multiprocessing.cpu_count()
+        self.__min_chunk_chars = min_chunk_chars
+        self.__pool = None
+
+    @property
+    def processes(self):
+        return self.__processes
+
+    @property
+    def pool(self):
+        if self.__pool is None:
+            self.__pool = multiprocessing.Pool(self.__processes)
+        return self.__pool
+
+    def chunk_chars(self, data):
+        total = sum(len(message) for channels in data.values()
+                    for messages in channels.values() for message in messages)
+        return max(self.__min_chunk_chars, total // (self.__processes * CHUNKS_PER_PROCESS) + 1)
+
+    def run(self, data):
+        '''
+        Returns a new {source: {channel: [results]}} with the same keys as data.
+        '''
+        result = {source: {channel: [None] * len(messages) for channel, messages in channels.items()}
+                  for source, channels in data.items()}
+
+        chunks = make_chunks(data, self.chunk_chars(data))
+        tasks = [(self.__func, segments) for segments in chunks]
+        if len(tasks) > 1:
+            processed_chunks = self.pool.starmap(process_chunk, tasks, chunksize=1)
+        else:
+            # Мелкий ввод обрабатывается на месте, без пересылки в пул
+            processed_chunks = [process_chunk(*task) for task in tasks]
+
+        for segments in processed_chunks:
+            for source, channel, start, processed in segments:
+                result[source][channel][start:start + len(processed)] = processed
+        return result
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,246 @@
+import os
+import json
+from collections import Counter
+from itertools import chain
+
+TOP_K = 10
+# Журнал сливается в снимок, когда в нем накопилось столько записей
+COMPACT_RECORDS = 1000
+
+
+def count_messages(messages, known_hashtags=()):
+    '''
+    Keyword and hashtag Counters of tokenized messages, pairs (words,
+    hashtags) from Tokenizer.tokenize. Words that match a hashtag of these
+    messages or of known_hashtags are not keywords.
+    '''
+    hashtags = Counter(chain.from_iterable(tags for words, tags in messages))
+    # Хэштеги уже в нижнем регистре, проверка по хэш-таблицам
+    keywords = Counter(word for words, tags in messages for word in words
+                       if word.lower() not in hashtags and word.lower() not in known_hashtags)
+    return keywords, hashtags
+
+
+class TopK:
+    '''
+    The k most common keys of a Counter whose counts mostly grow. A key can
+    get into the top only when its own count grows, so an update looks only
+    at the changed keys. When a key of the top shrinks, the top is rebuilt
+    from the whole Counter.
+    '''
+    def __init__(self, k=TOP_K):
+        self.__k = k
+        self.__items = {}
+        self.__lowest = None
+
+    def update(self, counter, keys):
+        items = self.__items
+        for key in keys:
+            count = counter[key]
+            if key in items:
+                items[key] = count
+                if self.__lowest is not None and self.__lowest[1] == key:
+                    self.__lowest = None
+            elif len(items) < self.__k:
+                items[key] = count
+                self.__lowest = None
+            else:
+                lowest_count, lowest_key = self.lowest()
+                if count > lowest_count:
+                    del items[lowest_key]
+                    items[key] = count
+                    self.__lowest = None
+
+    def discard(self, counter, keys):
+        # Уменьшился счетчик ключа из топа: на его место может встать любой ключ
+        if any(key in self.__items for key in keys):
+            self.__items = dict(counter.most_common(self.__k))
+            self.__lowest = None
+
+    def lowest(self):
+        # Наименьший элемент пересчитывается, только когда состав топа или его минимум изменился
+        if self.__lowest is None:
+            key = min(self.__items, key=self.__items.get)
+            self.__lowest = (self.__items[key], key)
+        return self.__lowest
+
+    def most_common(self):
+        return sorted(self.__items.items(), key=lambda item: item[1], reverse=True)
+
+
+class Stats:
+    '''
+    Keyword and hashtag counts of a channel, a source or everything, with
+    their tops.
+    '''
+    def __init__(self, k=TOP_K):
+        self.keywords = Counter()
+        self.hashtags = Counter()
+        self.top_keywords = TopK(k)
+        self.top_hashtags = TopK(k)
+
+    def merge(self, keywords, hashtags):
+        '''
+        Adds deltas. A negative keyword count removes the earlier counts of a
+        word that became a hashtag.
+        '''
+        self.keywords.update(keywords)
+        self.hashtags.update(hashtags)
+        removed = [word for word, count in keywords.items() if count < 0]
+        for word in removed:
+            if self.keywords[word] <= 0:
+                del self.keywords[word]
+        self.top_keywords.update(self.keywords, [word for word, count in keywords.items() if count > 0])
+        self.top_keywords.discard(self.keywords, removed)
+        self.top_hashtags.update(self.hashtags, hashtags)
+
+    def report(self):
+        top_keywords = self.top_keywords.most_common()
+        return {
+            'topics': [topic for topic, count in top_keywords],
+            'keywords': dict(top_keywords),
+            'hashtags': dict(self.top_hashtags.most_common()),
+        }
+
+
+class AnalyticsState:
+    '''
+    Persistent analytics of all channels: keyword and hashtag Counters of
+    each channel and the id of its last processed post. New posts are merged
+    as deltas into the channel, its source and the overall totals, so a
+    refresh costs time proportional to new posts, not to history. Counts are
+    the same as analyze_messages over all posts of a channel at once: when
+    a word becomes a hashtag of the channel, its earlier keyword counts are
+    taken back by a negative delta.
+
+    On disk it is a snapshot <path>.json and a journal <path>.log of merged
+    deltas, one JSON line each. The journal is replayed on load and folded
+    into the snapshot every COMPACT_RECORDS records. Records carry the
+    generation of the snapshot they follow, so a journal left over from an
+    interrupted compaction is not applied twice.
+    '''
+    def __init__(self, path, k=TOP_K):
+        self.__snapshot_path = f"{path}.json"
+        self.__journal_path = f"{path}.log"
+        self.__k = k
+        self.__channels = {}
+        # Ключевые слова каждого канала по нижнему регистру, чтобы найти их по новому хэштегу
+        self.__keyword_forms = {}
+        self.__last_ids = {}
+        self.__sources = {}
+        self.__total = Stats(k)
+        self.__records = 0
+        self.__generation = 0
+
+        if os.path.exists(self.__snapshot_path):
+            with open(self.__snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.__generation = snapshot['generation']
+            for record in snapshot['channels']:
+                self.__apply(record)
+        if os.path.exists(self.__journal_path):
+            with open(self.__journal_path, encoding='utf-8') as f:
+                for line in f:
+                    # Недописанная при сбое последняя строка отбрасывается
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    if record['generation'] < self.__generation:
+                        continue
+                    self.__apply(record)
+                    self.__records += 1
+        self.__journal = open(self.__journal_path, 'a', encoding='utf-8')
+
+    def __apply(self, record):
+        source, channel = record['source'], record['channel']
+        key = (source, channel)
+        if key not in self.__channels:
+            self.__channels[key] = Stats(self.__k)
+        if source not in self.__sources:
+            self.__sources[source] = Stats(self.__k)
+        keywords, hashtags = Counter(record['keywords']), Counter(record['hashtags'])
+        for stats in (self.__channels[key], self.__sources[source], self.__total):
+            stats.merge(keywords, hashtags)
+        forms = self.__keyword_forms.setdefault(key, {})
+        for word, count in keywords.items():
+            if count > 0:
+                forms.setdefault(word.lower(), set()).add(word)
+            elif word not in self.__channels[key].keywords:
+                forms[word.lower()].discard(word)
+        if record['last_id'] is not None:
+            self.__last_ids[key] = record['last_id']
+
+    def last_ids(self, source):
+        '''
+        {channel: id of the last processed post} of a source.
+        '''
+        return {channel: last_id for (name, channel), last_id in self.__last_ids.items() if name == source}
+
+    def merge(self, source, channel, messages, last_id):
+        '''
+        Adds tokenized new posts of a channel and moves its last id forward.
+        '''
+        key = (source, channel)
+        if not messages and (last_id is None or self.__last_ids.get(key) == last_id):
+            return
+        # Слова, совпадающие с прежними хэштегами канала, тоже не ключевые
+        stats = self.__channels.get(key)
+        keywords, hashtags = count_messages(messages, stats.hashtags if stats is not None else ())
+        if stats is not None:
+            # Новый хэштег канала отменяет прежние счетчики совпадающих с ним слов
+            forms = self.__keyword_forms[key]
+            for hashtag in hashtags:
+                if hashtag not in stats.hashtags:
+                    for word in forms.get(hashtag, ()):
+                        keywords[word] -= stats.keywords[word]
+        record = {'source': source, 'channel': channel, 'last_id': last_id,
+                  'keywords': keywords, 'hashtags': hashtags, 'generation': self.__generation}
+        self.__apply(record)
+        self.__journal.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.__journal.flush()
+        self.__records += 1
+        if self.__records >= COMPACT_RECORDS:
+            self.compact()
+
+    def compact(self):
+        records = [{'source': source, 'channel': channel, 'last_id': self.__last_ids.get((source, channel)),
+                    'keywords': stats.keywords, 'hashtags': stats.hashtags}
+                   for (source, channel), stats in self.__channels.items()]
+        # Снимок подменяется целиком, журнал очищается только после этого
+        self.__generation += 1
+        with open(f"{self.__snapshot_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'generation': self.__generation, 'channels': records}, f, ensure_ascii=False)
+        os.replace(f"{self.__snapshot_path}.tmp", self.__snapshot_path)
+        self.__journal.truncate(0)
+        self.__records = 0
+
+    def report(self):
+        '''
+        Tops of every channel, source and overall, in the shape of the old
+        dump.json but with top-k keywords and hashtags instead of full counts.
+        '''
+        result = {}
+        for (source, channel), stats in self.__channels.items():
+            channel_report = stats.report()
+            channel_report['last_id'] = self.__last_ids.get((source, channel))
+            result.setdefault(source, {})[channel] = channel_report
+        for source, stats in self.__sources.items():
+            report = stats.report()
+            result[source]['common_topics'] = report['topics']
+            result[source]['common_keywords'] = report['keywords']
+            result[source]['common_hashtags'] = report['hashtags']
+        report = self.__total.report()
+        result['common_topics'] = report['topics']
+        result['common_keywords'] = report['keywords']
+        result['common_hashtags'] = report['hashtags']
+        return result
+
+    def close(self):
+        self.__journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,311 @@
+import re
+from itertools import compress
+
+# Правила ниже скопированы из этой версии nltk; check_tokenizer.py сверяет их с установленной
+NLTK_VERSION = '3.10.3'
+
+# Упоминания вида [club1|Название] и ссылки вырезаются до разбиения на слова
+MENTIONS = re.compile(r'\[.*?\]')
+LINKS = re.compile(r'http\S+')
+# Хэштеги выделяются до разбора знаков препинания, иначе от них остается только слово без #.
+# Ищутся после удаления ссылок, чтобы якоря вида site.ru/#part не считались хэштегами.
+# Шаблон начинается с самого символа #: так re ищет его быстрым поиском, а не с каждой позиции
+HASHTAGS = re.compile(r'#(?<!\w#)(\w*[^\W_]\w*)')
+# Слова из одних закрывающих кавычек и скобок не мешают отделить точку в конце текста
+CLOSING = frozenset(']})>"\'»”’')
+
+
+def substitution_function(template):
+    # Шаблон вида r" \1 \g<0>" превращается в строку формата: подстановка через
+    # str.format в несколько раз быстрее разбора шаблона в re.sub. Шаблон без
+    # ссылок на группы re.sub подставляет сам без вызова функции
+    if '\\' not in template:
+        return template
+    fmt = re.sub(r"\\g<(\d+)>|\\(\d)", lambda match: f"{{{match[1] or match[2]}}}",
+                 template.replace('{', '{{').replace('}', '}}'))
+    return lambda match: fmt.format(match[0], *match.groups(default=''))
+
+
+def rule_group(rules):
+    '''
+    Rules with substitution functions, and one regexp that matches wherever
+    any of the rules does.
+    '''
+    patterns = [f"(?i:{regexp.pattern[4:]})" if regexp.pattern.startswith('(?i)') else f"(?:{regexp.pattern})"
+                for regexp, substitution in rules]
+    return re.compile('|'.join(patterns)), [(regexp, substitution_function(substitution))
+                                            for regexp, substitution in rules]
+
+
+# Правила NLTKWordTokenizer (nltk.word_tokenize) в том же порядке. Применяются
+# только к словам со знаками препинания внутри, обычные слова проходят без них
+STARTING_QUOTES = rule_group([
+    (re.compile(r"([«“‘„]|[`]+)"), r" \1 "),
+    (re.compile(r"(``)"), r" \1 "),
+    (re.compile(r"([ \(\[{<])(\"|\'{2})"), r"\1 `` "),
+    (re.compile(r"(?i)(?<!\w)(\')(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)"), r"\1 "),
+])
+# Отделение точки в конце предложения, остальные правила применяются к любому месту
+SENTENCE_END = rule_group([(re.compile(r"([^\.])(\.)([\]\)}>\"\'»”’ ]*)\s*$"), r"\1 \2 \3 ")])
+LAST_PERIOD = rule_group([(re.compile(r"([^\.])(\.)([\]\)}>\"\']*)\s*$"), r"\1 \2\3 ")])
+PUNCTUATION = rule_group([
+    (re.compile(r"([:,])([^\d])"), r" \1 \2"),
+    (re.compile(r"([:,])$"), r" \1 "),
+    (re.compile(r"\.{2,}"), r" \g<0> "),
+    (re.compile(r"[;@#$%&]"), r" \g<0> "),
+    (re.compile(r"[\u2012-\u2015]"), r" \g<0> "),
+])
+PUNCTUATION_AFTER_PERIOD = rule_group([
+    (re.compile(r"[?!]"), r" \g<0> "),
+    (re.compile(r"([^'])' "), r"\1 ' "),
+    (re.compile(r"[*]"), r" \g<0> "),
+    (re.compile(r"[\]\[\(\)\{\}\<\>]"), r" \g<0> "),
+    (re.compile(r"--"), r" -- "),
+])
+ENDING_QUOTES = rule_group([
+    (re.compile(r"([»”’])"), r" \1 "),
+    (re.compile(r"''"), r" '' "),
+    (re.compile(r'"'), r" '' "),
+    (re.compile(r"\s+"), r" "),
+    (re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "), r"\1 \2 "),
+    (re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r"\1 \2 "),
+])
+CONTRACTIONS = rule_group([
+    (re.compile(r"(?i)\b(can)(not)\b"), r" \1 \2 "),
+    (re.compile(r"(?i)\b(d)('ye)\b"), r" \1 \2 "),
+    (re.compile(r"(?i)\b(gim)(me)\b"), r" \1 \2 "),
+    (re.compile(r"(?i)\b(gon)(na)\b"), r" \1 \2 "),
+    (re.compile(r"(?i)\b(got)(ta)\b"), r" \1 \2 "),
+    (re.compile(r"(?i)\b(lem)(me)\b"), r" \1 \2 "),
+    (re.compile(r"(?i)\b(more)('n)\b"), r" \1 \2 "),
+    (re.compile(r"(?i)\b(wan)(na)(?=\s)"), r" \1 \2 "),
+    (re.compile(r"(?i) ('t)(is)\b"), r" \1 \2 "),
+    (re.compile(r"(?i) ('t)(was)\b"), r" \1 \2 "),
+])
+# Без кавычек и апострофов правила для них можно не применять
+QUOTES = re.compile(r"[«“‘„`»”’\"']")
+CONTRACTED = frozenset(['cannot', 'gimme', 'gonna', 'gotta', 'lemme', 'wanna'])
+
+# Слово, окруженное только знаками, которые токенизатор всегда отделяет:
+# «Слово», (слово)... #слово. Точка в конце отделяется только в конце предложения.
+# Внутри слова могут быть знаки, которые не отделяются: тогда это не токен
+SEPARATOR_CHARS = "«“‘„`»”’\"()[]{}<>;@#$%&*?!\u2012\u2013\u2014\u2015"
+SEPARATORS = re.escape(SEPARATOR_CHARS)
+# Запятая и двоеточие отделяются в конце слова, но не в начале
+TRAILING_CHARS = SEPARATOR_CHARS + ',:'
+INSEPARABLE = rf"[^\w\s{SEPARATORS},:.'\-]|_|(?<!-)-(?!-)|\.(?=[^\W_])|[:,](?=\d)"
+SIMPLE_WORD = re.compile(
+    rf"(?:[{SEPARATORS}]|\.\.+)*((?:[^\W_]|{INSEPARABLE})+)((?:[{SEPARATORS},:]|\.\.+)*)(\.?)")
+ALPHANUMERIC = re.compile(r"[^\W_]")
+# Без этих подстрок (в нижнем регистре) не срабатывает ни одно правило CONTRACTIONS
+CONTRACTION = re.compile(r"cannot|gimme|gonna|gotta|lemme|wanna|'ye|'n|'t")
+
+# Границы предложений по правилам PunktSentenceTokenizer (nltk.sent_tokenize)
+# без обученных сокращений и статистики регистра слов
+SENTENCE_END_CHARS = frozenset('.?!')
+PUNKT_PUNCTUATION = frozenset(';:,.!?')
+NON_WORD_CHARS = ')";}]*:@\'({[‘’“”«»?!'
+PUNKT_WORD = re.compile(r"""(
+    (?:\-{2,}|\.{2,}|(?:\.\s){2,}\.)
+    |
+    (?=[^\(\"\`{\[:;&\#\*@\)}\]\-,])\S+?
+    (?=
+        \s|$|
+        [)\";}\]\*:@\'\({\[‘’“”«»?!]|(?:\-{2,}|\.{2,}|(?:\.\s){2,}\.)|
+        ,(?=$|\s|[)\";}\]\*:@\'\({\[‘’“”«»?!]|(?:\-{2,}|\.{2,}|(?:\.\s){2,}\.))
+    )
+    |
+    \S
+)""", re.VERBOSE)
+PUNKT_NUMBER = re.compile(r"^-?[\.,]?\d[\d,\.-]*\.?$")
+PUNKT_INITIAL = re.compile(r"[^\W\d]\.$")
+PUNKT_ELLIPSIS = re.compile(r"\.\.+$")
+# Кавычки и скобки сразу после конца предложения переносятся в него
+PUNKT_REALIGN = re.compile(r'["\')\]}‘’“”«»]+?(?:\s+|(?=--)|$)')
+REALIGN_CHARS = frozenset('"\')]}‘’“”«»')
+OPENING_QUOTES = frozenset('«“‘')
+
+
+def apply_rules(rules, text):
+    any_rule, rules = rules
+    # Чаще всего в группе не срабатывает ни одно правило, и хватает одного поиска
+    if not any_rule.search(text):
+        return text
+    for regexp, substitution in rules:
+        text = regexp.sub(substitution, text)
+    return text
+
+
+def is_sentence_break(context):
+    '''
+    Whether punkt finds a sentence break in context: the word before a
+    possible sentence end, the end character and the text right after it.
+    '''
+    # Чаще всего это "слово. Слово" из двух токенов, которые видны и без PUNKT_WORD
+    head, space, tail = context.partition(' ')
+    if tail.isalnum() and head[-1:] == '.' and head[:-1].isalnum():
+        tokens = [head, tail]
+    else:
+        tokens = PUNKT_WORD.findall(context)
+    for i, token in enumerate(tokens[:-1]):
+        if token in SENTENCE_END_CHARS:
+            return True
+        if not token.endswith('.') or token.endswith('..') or PUNKT_ELLIPSIS.match(token):
+            continue
+        # Число или инициал перед строчной буквой или знаком препинания - не конец предложения
+        if PUNKT_INITIAL.match(token) or PUNKT_NUMBER.match(token.lower()):
+            next_token = tokens[i + 1]
+            if next_token in PUNKT_PUNCTUATION or next_token[0].islower():
+                continue
+            if PUNKT_INITIAL.match(token) and next_token[0].isupper():
+                continue
+        return True
+    return False
+
+
+class Tokenizer:
+    '''
+    Single pass replacement for the chain of regex cleanup, stop word
+    filtering, nltk.word_tokenize and removal of non-alphanumeric tokens.
+    Hashtags are taken out before that and returned separately. Plain words
+    are taken as is, the nltk rules run only for words with punctuation
+    inside.
+
+    Sentence ends follow punkt without its trained English model: after
+    abbreviations from that model (Mr., U.S.) nltk keeps the period on the
+    word and drops it, here the word is kept.
+    '''
+    def __init__(self, stop_words):
+        self.__stop_words = frozenset(stop_words)
+
+    def clean(self, text):
+        '''
+        Text without mentions, links and hashtags, and the hashtags in lower
+        case without #.
+        '''
+        # Проверка подстроки дешевле прохода регулярного выражения по тексту без совпадений
+        if '[' in text:
+            text = MENTIONS.sub('', text)
+        if 'http' in text:
+            text = LINKS.sub('', text)
+        if '#' not in text:
+            return text, []
+        hashtags = [hashtag.lower() for hashtag in HASHTAGS.findall(text)]
+        return HASHTAGS.sub(' ', text), hashtags
+
+    def tokenize(self, text):
+        '''
+        Word tokens and hashtags of text as two separate lists.
+        '''
+        text, hashtags = self.clean(text)
+        stop_words = self.__stop_words
+        lowered = text.lower().split()
+        words = list(compress(text.split(), [word not in stop_words for word in lowered]))
+        last = len(words) - 1
+        while last >= 0 and CLOSING.issuperset(words[last]) and words[last][0] != '"' and words[last][:2] != "''":
+            last -= 1
+
+        # Большинство слов уже токены, отдельно разбираются только слова со знаками
+        if CONTRACTED.isdisjoint(lowered):
+            special = [i for i, word in enumerate(words) if not word.isalnum()]
+            if last < len(words) - 1:
+                special = [i for i in special if i <= last]
+        else:
+            special = [i for i in range(last + 1) if not words[i].isalnum() or words[i].lower() in CONTRACTED]
+        tokens = []
+        start = 0
+        for i in special:
+            tokens += words[start:i]
+            tokens += self.tokenize_at(words, i, last)
+            start = i + 1
+        tokens += words[start:last + 1]
+        return tokens, hashtags
+
+    def tokenize_at(self, words, i, last):
+        word = words[i]
+        next_word = words[i + 1] if i + 1 < len(words) else None
+        # Чаще всего знаки стоят только по краям слова, а точка - только последней: тогда
+        # части SIMPLE_WORD находятся без регулярного выражения
+        period = word[-1] == '.' and word[-2:-1] != '.'
+        stripped = (word[:-1] if period else word).lstrip(SEPARATOR_CHARS)
+        core = stripped.rstrip(TRAILING_CHARS)
+        if not core:
+            return []
+        if core.isalnum():
+            separated = core != stripped
+        # Одиночные дефисы внутри не отделяются, и с ними слово тоже совпадает с SIMPLE_WORD
+        elif '--' in core or not core.replace('-', '').isalnum():
+            match = SIMPLE_WORD.fullmatch(word)
+            if not match:
+                if not ALPHANUMERIC.search(word):
+                    return []
+                return self.tokenize_word(word, next_word, i == last)
+            core, separated, period = match[1], match[2], match[3]
+        if not core.isalnum():
+            if not CONTRACTION.search(core.lower()):
+                return []
+            return self.tokenize_word(word, next_word, i == last)
+        if core.lower() in CONTRACTED:
+            return self.tokenize_word(word, next_word, i == last)
+        if not period or separated or i == last:
+            return [core]
+        # Точка сразу после слова отделяется, только если на ней заканчивается предложение.
+        # Решение зависит от следующего слова только после чисел и инициалов
+        if not (len(core) > 1 and not core.isdecimal() or is_sentence_break(f"{word} {next_word}")):
+            return []
+        # Открывающие кавычки, перенесенные в конец предложения, мешают отделить точку
+        realigned = next_word[0] in REALIGN_CHARS and PUNKT_REALIGN.match(next_word + ' ')
+        if realigned and (realigned[0][0] == '"' or realigned[0][:2] == "''"
+                          or not OPENING_QUOTES.isdisjoint(realigned[0])):
+            return []
+        return [core]
+
+    def tokenize_word(self, word, next_word=None, text_end=True):
+        '''
+        Full rule set for one word. next_word is None at the end of the text,
+        text_end is also set when only closing quotes and brackets follow.
+        '''
+        parts = [(word, text_end)]
+        # Внутри слова предложение может закончиться только на последнем возможном конце
+        for end in range(len(word) - 1, -1, -1):
+            if word[end] not in SENTENCE_END_CHARS:
+                continue
+            if end + 1 < len(word):
+                if word[end + 1] not in NON_WORD_CHARS:
+                    continue
+                after = word[end + 1]
+                rest = word[end + 1:]
+            elif next_word is not None:
+                after = ' ' + next_word
+                rest = next_word
+            else:
+                continue
+            if is_sentence_break(word[:end + 1] + after):
+                realigned = PUNKT_REALIGN.match(rest + ' ')
+                realigned = realigned[0].rstrip() if realigned else ''
+                if end + 1 < len(word):
+                    parts = [(word[:end + 1] + realigned, True), (word[end + 1:], text_end)]
+                else:
+                    parts = [(f"{word} {realigned}", True)]
+            break
+
+        tokens = []
+        for part, sentence_end in parts:
+            # Конец предложения - конец строки для правил, иначе дальше идет пробел
+            text = f" {part}" if sentence_end else f" {part} "
+            quoted = QUOTES.search(part)
+            if quoted:
+                text = apply_rules(STARTING_QUOTES, text)
+            period = sentence_end and '.' in part
+            if period:
+                text = apply_rules(SENTENCE_END, text)
+            text = apply_rules(PUNCTUATION, text)
+            if period:
+                text = apply_rules(LAST_PERIOD, text)
+            text = f" {apply_rules(PUNCTUATION_AFTER_PERIOD, text)} "
+            if quoted:
+                text = apply_rules(ENDING_QUOTES, text)
+            if CONTRACTION.search(part.lower()):
+                text = apply_rules(CONTRACTIONS, text)
+            tokens.extend(token for token in text.split() if token.isalnum())
+        return tokens